@@ -0,0 +1,27 @@
+import uuid
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from services.affinity import WorkerRegistry, get_worker_registry
+
+router = APIRouter()
+
+
+@router.get("/nginx-map", response_class=PlainTextResponse)
+async def get_nginx_map(
+    registry: Annotated[WorkerRegistry, Depends(get_worker_registry)],
+):
+    return registry.render_nginx_map()
+
+
+@router.get("/{party_id}")
+async def get_party_owner(
+    party_id: uuid.UUID,
+    registry: Annotated[WorkerRegistry, Depends(get_worker_registry)],
+):
+    worker_id = registry.get_owner(party_id)
+    return {
+        "worker_id": worker_id,
+        "address": registry.addresses.get(worker_id),
+    }
@@ -0,0 +1,20 @@
+from typing import Annotated
+
+from core.config import settings
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from services.drain import DrainService, get_drain_service
+
+router = APIRouter()
+
+
+@router.post("")
+async def drain_worker(
+    drain_service: Annotated[DrainService, Depends(get_drain_service)],
+    x_drain_token: Annotated[str | None, Header()] = None,
+):
+    if not settings.drain_token or x_drain_token != settings.drain_token:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden"
+        )
+    await drain_service.drain()
+    return {"status": "drained"}
@@ -0,0 +1,31 @@
+import uuid
+from typing import Annotated
+
+from api.v1.auth import decode_token, security_jwt
+from fastapi import APIRouter, Depends
+from services.matchmaking import MatchmakingService, get_matchmaking_service
+
+router = APIRouter()
+
+
+@router.post("/{film_id}")
+async def enqueue_for_film(
+    film_id: uuid.UUID,
+    token: Annotated[str, Depends(security_jwt)],
+    matchmaking_service: Annotated[
+        MatchmakingService, Depends(get_matchmaking_service)
+    ],
+):
+    user_id = uuid.UUID(decode_token(token)["user_id"])
+    return await matchmaking_service.enqueue(user_id, film_id)
+
+
+@router.delete("")
+async def cancel_waiting(
+    token: Annotated[str, Depends(security_jwt)],
+    matchmaking_service: Annotated[
+        MatchmakingService, Depends(get_matchmaking_service)
+    ],
+):
+    user_id = uuid.UUID(decode_token(token)["user_id"])
+    return {"cancelled": await matchmaking_service.cancel(user_id)}
@@ -0,0 +1,10 @@
+from core.metrics import metrics
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+router = APIRouter()
+
+
+@router.get("", response_class=PlainTextResponse)
+async def export_metrics() -> str:
+    return metrics.render()
@@ -0,0 +1,47 @@
+import uuid
+from typing import Annotated
+
+from api.v1.auth import decode_token, security_jwt
+from fastapi import APIRouter, Depends, HTTPException, status
+from services.presence import PresenceService, get_presence_service
+
+router = APIRouter()
+
+
+@router.get("/current")
+async def get_current_party(
+    token: Annotated[str, Depends(security_jwt)],
+    presence_service: Annotated[
+        PresenceService, Depends(get_presence_service)
+    ],
+):
+    username = decode_token(token)["username"]
+    party_id = await presence_service.get_current_party(username)
+    if party_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Not in a party"
+        )
+    return {"party_id": party_id}
+
+
+@router.get("/{party_id}/members")
+async def get_party_members(
+    party_id: uuid.UUID,
+    token: Annotated[str, Depends(security_jwt)],
+    presence_service: Annotated[
+        PresenceService, Depends(get_presence_service)
+    ],
+):
+    members = await presence_service.get_members(party_id)
+    return {"members": members, "count": len(members)}
+
+
+@router.get("/{party_id}/members/count")
+async def get_party_members_count(
+    party_id: uuid.UUID,
+    token: Annotated[str, Depends(security_jwt)],
+    presence_service: Annotated[
+        PresenceService, Depends(get_presence_service)
+    ],
+):
+    return {"count": await presence_service.count(party_id)}
@@ -1,40 +1,93 @@
+import hashlib
 import uuid
 from pathlib import Path
 from typing import Annotated
 
 from api.v1.auth import security_jwt
 from core.config import settings
-from fastapi import APIRouter, Depends, Request
+from core.lru import TTLLRUCache
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
 from fastapi.templating import Jinja2Templates
+from services.affinity import WorkerRegistry, get_worker_registry
 from services.broker import PartyManagerService, get_party_manager_service
 
 router = APIRouter()
 
 templates_dir = Path(__file__).parents[2].joinpath("templates")
 templates = Jinja2Templates(directory=templates_dir)
+stream_template = templates.get_template("stream.html")
+# The shell only depends on the film, so every party watching it shares
+# one rendered body.
+stream_pages = TTLLRUCache(
+    settings.stream_page_cache_size, settings.stream_page_cache_ttl
+)
+
+
+def render_stream_page(film_id: str) -> tuple[bytes, str]:
+    page = stream_pages.get(film_id)
+    if page is None:
+        body = stream_template.render(
+            stream_link=f"{settings.media_service_url}/{film_id}/{film_id}.m3u8"
+        ).encode("utf-8")
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        page = body, etag
+        stream_pages.set(film_id, page)
+    return page
 
 
 @router.get("/{party_id}")
 async def stream_film(
     request: Request,
     party_id: uuid.UUID,
-    token: Annotated[str, Depends(security_jwt)],
     party_manager_service: Annotated[
         PartyManagerService, Depends(get_party_manager_service)
     ],
 ):
-    party = await party_manager_service.find_party_by_id(party_id=party_id)
-    film_id = party["film_id"]
+    party = await party_manager_service.get_party_metadata(party_id=party_id)
     if not party:
         return templates.TemplateResponse(
-            "forbidden.html", {"request": request}
+            "forbidden.html",
+            {"request": request},
+            headers={"Cache-Control": "no-store"},
+        )
+    body, etag = render_stream_page(str(party["film_id"]))
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.stream_page_max_age}",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    return Response(body, media_type="text/html", headers=headers)
+
+
+@router.get("/{party_id}/bootstrap")
+async def stream_bootstrap(
+    party_id: uuid.UUID,
+    token: Annotated[str, Depends(security_jwt)],
+    party_manager_service: Annotated[
+        PartyManagerService, Depends(get_party_manager_service)
+    ],
+    registry: Annotated[WorkerRegistry, Depends(get_worker_registry)],
+    response: Response,
+):
+    party = await party_manager_service.get_party_metadata(party_id=party_id)
+    if not party:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Party not found"
         )
-    return templates.TemplateResponse(
-        "stream.html",
-        {
-            "request": request,
-            "stream_link": f"{settings.media_service_url}/{film_id}/{film_id}.m3u8",
-            "websocket_stream_link": f"/stream/{party_id}?token={token}",
-            "websocket_chat_link": f"/chat/{party_id}?token={token}",
-        },
-    )
+    response.headers["Cache-Control"] = "no-store"
+    # nginx routes both sockets of the party to its owner by this parameter.
+    query = f"token={token}&worker={registry.get_owner(party_id)}"
+    return {
+        "websocket_stream_link": f"/stream/{party_id}?{query}",
+        "websocket_chat_link": f"/chat/{party_id}?{query}",
+    }
@@ -1,6 +1,6 @@
 import time
 import uuid
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 
 import jwt
 from core.config import settings
@@ -12,6 +12,13 @@ from fastapi import (
     WebSocketException,
     status,
 )
+from integration.websocket import select_subprotocol
+from services.admission import (
+    AdmissionRejected,
+    ConnectionAdmissionService,
+    get_connection_admission_service,
+)
+from services.affinity import WorkerRegistry, get_worker_registry
 from services.websocket import (
     WebSocketChatConnectionService,
     WebSocketStreamConnectionService,
@@ -21,6 +28,8 @@ from services.websocket import (
 
 router = APIRouter()
 
+PARTY_MOVED_CLOSE_CODE = 4001
+
 
 async def decode_token(token: Annotated[str, Query()]) -> dict:
     try:
@@ -39,16 +48,65 @@ async def decode_token(token: Annotated[str, Query()]) -> dict:
         )
 
 
+async def admit_stream_connection(
+    token: Annotated[dict, Depends(decode_token)],
+    admission_service: Annotated[
+        ConnectionAdmissionService, Depends(get_connection_admission_service)
+    ],
+    device_id: Annotated[str | None, Query()] = None,
+) -> AsyncIterator[dict]:
+    user_id = str(token["user_id"])
+    device_id = device_id or uuid.uuid4().hex
+    try:
+        await admission_service.acquire(user_id, device_id)
+    except AdmissionRejected as e:
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION, reason=e.reason
+        )
+    try:
+        yield token
+    finally:
+        await admission_service.release(user_id, device_id)
+
+
+async def redirect_to_owner(
+    party_id: uuid.UUID, websocket: WebSocket, registry: WorkerRegistry
+) -> bool:
+    if registry.draining:
+        await websocket.accept()
+        await websocket.close(code=status.WS_1012_SERVICE_RESTART)
+        return True
+    if registry.owns(party_id):
+        return False
+    owner = registry.get_owner(party_id)
+    # A socket that asked for the current owner but still landed here was
+    # misrouted by the proxy; it is served anyway instead of bounced.
+    if websocket.query_params.get("worker") == owner:
+        return False
+    await websocket.accept()
+    await websocket.close(code=PARTY_MOVED_CLOSE_CODE, reason=owner)
+    return True
+
+
 @router.websocket("/ws/stream/{party_id}")
 async def stream_party_connection(
     party_id: uuid.UUID,
     websocket: WebSocket,
+    token: Annotated[dict, Depends(admit_stream_connection)],
     websocket_stream_connection_service: Annotated[
         WebSocketStreamConnectionService,
         Depends(get_websocket_stream_connection_service),
     ],
+    registry: Annotated[WorkerRegistry, Depends(get_worker_registry)],
 ):
-    await websocket_stream_connection_service.connect(party_id, websocket)
+    if await redirect_to_owner(party_id, websocket, registry):
+        return
+    await websocket_stream_connection_service.connect(
+        token["username"],
+        party_id,
+        websocket,
+        select_subprotocol(websocket.scope.get("subprotocols", [])),
+    )
 
 
 @router.websocket("/ws/chat/{party_id}")
@@ -60,7 +118,11 @@ async def chat_party_stream_connection(
         WebSocketChatConnectionService,
         Depends(get_websocket_chat_connection_service),
     ],
+    registry: Annotated[WorkerRegistry, Depends(get_worker_registry)],
+    last_seq: Annotated[int | None, Query()] = None,
 ):
+    if await redirect_to_owner(party_id, websocket, registry):
+        return
     await websocket_chat_connection_service.connect(
-        token["username"], party_id, websocket
+        token["username"], party_id, websocket, last_seq
     )
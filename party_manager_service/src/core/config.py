@@ -13,6 +13,7 @@ class Settings(BaseSettings):
     mongodb_url: str = "mongodb://localhost:27017/"
     mongodb_database_name: str = "partyDb"
     mongodb_notifications_collection_name: str = "parties"
+    mongodb_chat_collection_name: str = "chat_messages"
 
     rabbitmq_host: str = "rabbitmq"
     rabbitmq_port: int = 5672
@@ -24,6 +25,93 @@ class Settings(BaseSettings):
     jwt_secret_key: str = "secret"
     jwt_algorithm: str = "HS256"
 
+    websocket_outbox_size: int = 64
+    websocket_send_timeout: float = 5.0
+    websocket_router_mode: str = "local"
+    websocket_channel_prefix: str = "party-manager-service"
+    # message type -> (tokens per second, burst)
+    websocket_rate_limits: dict[str, tuple[float, float]] = {
+        "default": (5.0, 10.0),
+        "ping": (1.0, 3.0),
+        "play": (2.0, 5.0),
+        "pause": (2.0, 5.0),
+        "seeked": (2.0, 5.0),
+        "chat": (1.0, 5.0),
+        "history": (1.0, 3.0),
+        "kick": (0.1, 1.0),
+        "vote": (1.0, 3.0),
+    }
+    websocket_party_rate_limits: dict[str, tuple[float, float]] = {
+        "play": (5.0, 10.0),
+        "pause": (5.0, 10.0),
+        "seeked": (5.0, 10.0),
+        "chat": (20.0, 40.0),
+    }
+    websocket_rate_limit_strikes: tuple[float, float] = (1.0, 20.0)
+
+    drain_token: str = ""
+    drain_wave_size: int = 200
+    drain_wave_interval: float = 0.5
+    drain_timeout: float = 20.0
+    drain_reconnect_jitter: float = 10.0
+
+    party_state_ttl: int = 6 * 60 * 60
+
+    playback_flush_interval: float = 1.0
+    playback_sync_interval: float = 5.0
+
+    chat_bucket_seconds: int = 3600
+    chat_bucket_size: int = 200
+    chat_bucket_cache_size: int = 10000
+    chat_history_limit: int = 50
+    chat_history_max_limit: int = 200
+    chat_history_bucket_batch: int = 4
+    chat_flush_interval: float = 0.5
+    chat_flush_batch_size: int = 50
+    chat_replay_buffer_size: int = 256
+    chat_replay_parties: int = 10000
+    chat_replay_ttl: float = 600.0
+    chat_seq_ttl: int = 24 * 60 * 60
+
+    party_metadata_cache_size: int = 10000
+    party_metadata_cache_ttl: float = 600.0
+
+    stream_page_cache_size: int = 1000
+    stream_page_cache_ttl: float = 600.0
+    stream_page_max_age: int = 60
+
+    matchmaking_room_size: int = 10
+    matchmaking_wait_timeout: int = 600
+    matchmaking_reap_interval: float = 5.0
+
+    party_creation_prefetch: int = 200
+    party_creation_batch_size: int = 100
+    party_creation_batch_interval: float = 0.05
+    party_creation_retries: int = 3
+
+    broker_publish_max_in_flight: int = 100
+
+    admission_max_devices: int = 5
+    admission_lease_ttl: float = 30.0
+    admission_heartbeat_interval: float = 10.0
+
+    gunicorn_workers: int = 1
+
+    affinity_enabled: bool = False
+    affinity_worker_id: str = ""
+    affinity_worker_address: str = ""
+    affinity_default_upstream: str = "party-manager-service:8000"
+    affinity_heartbeat_interval: float = 5.0
+    affinity_worker_ttl: float = 15.0
+    affinity_ring_replicas: int = 100
+
+    presence_ttl: int = 30
+    presence_heartbeat_interval: float = 10.0
+
+    kick_vote_duration: float = 30.0
+    kick_vote_quorum: int = 60
+    kick_vote_timer_tick: float = 1.0
+
 
 settings = Settings()
 
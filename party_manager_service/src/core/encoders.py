@@ -0,0 +1,31 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def dumps(message: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message, separators=(",", ":"))
+
+
+def loads(data: str | bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def packb(message: dict) -> bytes:
+    return msgpack.packb(message)
+
+
+def unpackb(data: bytes) -> dict:
+    return msgpack.unpackb(data)
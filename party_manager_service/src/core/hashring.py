@@ -0,0 +1,24 @@
+import bisect
+import hashlib
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+class HashRing:
+    def __init__(self, nodes: list[str], replicas: int):
+        points = sorted(
+            (_hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self.nodes = frozenset(nodes)
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def get_node(self, key: str) -> str:
+        index = bisect.bisect(self.hashes, _hash(key)) % len(self.hashes)
+        return self.owners[index]
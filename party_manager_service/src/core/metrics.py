@@ -0,0 +1,83 @@
+from collections import defaultdict
+
+LabelsKey = tuple[tuple[str, str], ...]
+
+
+def _labels_key(labels: dict) -> LabelsKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Summary:
+    __slots__ = ("count", "total", "maximum")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.counters: dict[str, dict[LabelsKey, float]] = defaultdict(dict)
+        self.gauges: dict[str, dict[LabelsKey, float]] = defaultdict(dict)
+        self.summaries: dict[str, dict[LabelsKey, Summary]] = defaultdict(dict)
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        series = self.counters[name]
+        key = _labels_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        self.gauges[name][_labels_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        series = self.summaries[name]
+        key = _labels_key(labels)
+        summary = series.get(key)
+        if summary is None:
+            summary = series[key] = Summary()
+        summary.observe(value)
+
+    def discard(self, **labels) -> None:
+        # Drops every series carrying the given labels, e.g. for a party
+        # that is no longer served by this process.
+        expected = set(_labels_key(labels))
+        for family in (self.counters, self.gauges, self.summaries):
+            for series in family.values():
+                for key in [key for key in series if expected <= set(key)]:
+                    del series[key]
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        for name, series in sorted(self.summaries.items()):
+            lines.append(f"# TYPE {name} summary")
+            for key, summary in series.items():
+                labels = _format_labels(key)
+                lines.append(f"{name}_count{labels} {summary.count}")
+                lines.append(f"{name}_sum{labels} {summary.total}")
+                lines.append(f"{name}_max{labels} {summary.maximum}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(key: LabelsKey) -> str:
+    if not key:
+        return ""
+    labels = ",".join(f'{name}="{value}"' for name, value in key)
+    return "{" + labels + "}"
+
+
+metrics = MetricsRegistry()
@@ -40,4 +40,4 @@ check_rabbitmq_cluster() {
 
 check_rabbitmq_cluster
 
-gunicorn main:app --workers 1 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
+gunicorn main:app --workers ${GUNICORN_WORKERS:-1} --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
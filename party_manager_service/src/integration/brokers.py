@@ -1,7 +1,11 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
 from functools import lru_cache
 from typing import Annotated
 
+from core.config import settings
+from core.metrics import metrics
 from fastapi import Depends
 from faststream.rabbit import RabbitBroker
 from pydantic import BaseModel
@@ -11,13 +15,18 @@ from .rabbitmq import get_rabbitmq
 
 class IBroker(ABC):
     @abstractmethod
-    async def publish_one(self, message: BaseModel, queue: str) -> None:
+    async def publish_one(
+        self, message: BaseModel, queue: str = "", exchange: str | None = None
+    ) -> None:
         pass
 
     @abstractmethod
     async def publish_many(
-        self, messages: list[BaseModel], queue: str
-    ) -> None:
+        self,
+        messages: list[BaseModel],
+        queue: str = "",
+        exchange: str | None = None,
+    ) -> list[bool]:
         pass
 
 
@@ -25,14 +34,51 @@ class RabbitMQBroker(IBroker):
     def __init__(self, broker: RabbitBroker):
         self.broker = broker
 
-    async def publish_one(self, message: BaseModel, queue: str) -> None:
-        await self.broker.publish(message=message, queue=queue)
+    async def publish_one(
+        self, message: BaseModel, queue: str = "", exchange: str | None = None
+    ) -> None:
+        await self.broker.publish(
+            message=message, queue=queue, exchange=exchange
+        )
 
     async def publish_many(
-        self, messages: list[BaseModel], queue: str
-    ) -> None:
-        for message in messages:
-            await self.broker.publish(message=message, queue=queue)
+        self,
+        messages: list[BaseModel],
+        queue: str = "",
+        exchange: str | None = None,
+    ) -> list[bool]:
+        # Publishes are pipelined: up to broker_publish_max_in_flight
+        # messages wait for their publisher confirms at the same time.
+        in_flight = asyncio.Semaphore(settings.broker_publish_max_in_flight)
+
+        async def publish(message: BaseModel) -> None:
+            async with in_flight:
+                await self.broker.publish(
+                    message=message, queue=queue, exchange=exchange
+                )
+
+        started_at = time.monotonic()
+        results = await asyncio.gather(
+            *(publish(message) for message in messages),
+            return_exceptions=True,
+        )
+        elapsed = time.monotonic() - started_at
+
+        delivered = [
+            not isinstance(result, BaseException) for result in results
+        ]
+        succeeded = sum(delivered)
+        metrics.increment("broker_published_messages_total", succeeded)
+        metrics.increment(
+            "broker_failed_messages_total", len(delivered) - succeeded
+        )
+        metrics.observe("broker_publish_many_seconds", elapsed)
+        if elapsed > 0:
+            metrics.set_gauge(
+                "broker_publish_many_messages_per_second",
+                len(messages) / elapsed,
+            )
+        return delivered
 
 
 @lru_cache
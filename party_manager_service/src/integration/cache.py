@@ -1,20 +1,24 @@
 import json
 import uuid
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from typing import Annotated
 
 import redis.asyncio as aioredis
+from core.config import settings
 from fastapi import Depends
 from integration.redis import get_redis_client
 
+PARTY_STATE_KEY_PREFIX = "party-manager:party:"
+
 
 class ICache(ABC):
     @abstractmethod
-    async def get(self, key: uuid.UUID):
+    async def get_party_state(self, party_id: uuid.UUID) -> dict | None:
         pass
 
     @abstractmethod
-    async def set(self, key: uuid.UUID, value: dict):
+    async def set_many(self, states: dict[uuid.UUID, dict]):
         pass
 
 
@@ -22,14 +26,41 @@ class RedisCache(ICache):
     def __init__(self, redis_client: aioredis.Redis):
         self.redis_client = redis_client
 
-    async def get(self, key: uuid.UUID):
-        return await self.redis_client.get(str(key))
+    @staticmethod
+    def party_state_key(party_id: uuid.UUID) -> str:
+        return f"{PARTY_STATE_KEY_PREFIX}{party_id}"
+
+    async def get_party_state(self, party_id: uuid.UUID) -> dict | None:
+        # Reading a party keeps it alive, so the TTL slides on reads too.
+        key = self.party_state_key(party_id)
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.hgetall(key)
+            pipeline.expire(key, settings.party_state_ttl)
+            fields, _ = await pipeline.execute()
+        if not fields:
+            return None
+        return {
+            field.decode("utf-8"): json.loads(value)
+            for field, value in fields.items()
+        }
 
-    async def set(self, key: uuid.UUID, value: dict):
-        await self.redis_client.set(str(key), json.dumps(value))
+    async def set_many(self, states: dict[uuid.UUID, dict]):
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            for party_id, fields in states.items():
+                key = self.party_state_key(party_id)
+                pipeline.hset(
+                    key,
+                    mapping={
+                        field: json.dumps(value)
+                        for field, value in fields.items()
+                    },
+                )
+                pipeline.expire(key, settings.party_state_ttl)
+            await pipeline.execute()
 
 
+@lru_cache
 def get_cache(
     redis_client: Annotated[aioredis.Redis, Depends(get_redis_client)],
-):
+) -> ICache:
     return RedisCache(redis_client)
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+from typing import NamedTuple
+
+from core.config import settings
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+
+
+class IndexSpec(NamedTuple):
+    collection_name: str
+    keys: list[tuple[str, int]]
+    name: str
+    options: dict = {}
+
+
+INDEXES = [
+    IndexSpec(
+        "parties",
+        [("party_id", 1)],
+        "party_id_unique",
+        {"unique": True},
+    ),
+    IndexSpec(
+        settings.mongodb_chat_collection_name,
+        [("party_id", 1), ("ts", 1)],
+        "chat_buckets_by_party",
+    ),
+]
+
+
+async def apply_indexes(database: AsyncIOMotorDatabase) -> None:
+    for index in INDEXES:
+        try:
+            await database[index.collection_name].create_index(
+                index.keys, name=index.name, **index.options
+            )
+        except OperationFailure as e:
+            print(f"Index {index.collection_name}.{index.name}: {e}")
+
+
+async def report_indexes(database: AsyncIOMotorDatabase) -> list[str]:
+    report = []
+    for collection_name in sorted(
+        {index.collection_name for index in INDEXES}
+    ):
+        collection = database[collection_name]
+        existing = {
+            index["name"]: index async for index in collection.list_indexes()
+        }
+        operations = {
+            stats["name"]: stats["accesses"]["ops"]
+            async for stats in collection.aggregate([{"$indexStats": {}}])
+        }
+        for index in INDEXES:
+            if (
+                index.collection_name == collection_name
+                and index.name not in existing
+            ):
+                report.append(
+                    f"missing {collection_name}.{index.name} {index.keys}"
+                )
+        for name in existing:
+            if name != "_id_" and not operations.get(name):
+                report.append(f"unused {collection_name}.{name}")
+    return report
+
+
+async def main(apply: bool) -> None:
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    database = client[settings.mongodb_database_name]
+    if apply:
+        await apply_indexes(database)
+    for line in await report_indexes(database):
+        print(line)
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report missing or unused party manager indexes."
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="create missing indexes before reporting",
+    )
+    asyncio.run(main(parser.parse_args().apply))
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import uuid
+
+import redis.asyncio as aioredis
+from core.config import settings
+
+SWEEP_LOCK_KEY = "party-manager:sweep:legacy-party-keys"
+
+
+def is_uuid(key: bytes) -> bool:
+    try:
+        return str(uuid.UUID(key.decode("utf-8"))) == key.decode("utf-8")
+    except ValueError:
+        return False
+
+
+def is_legacy_party_state(value: bytes) -> bool:
+    try:
+        state = json.loads(value)
+    except ValueError:
+        return False
+    return isinstance(state, dict) and "time" in state
+
+
+async def unlink_legacy_keys(
+    redis_client: aioredis.Redis, keys: list[bytes]
+) -> int:
+    # The auth service shares this Redis and keeps revoked token ids under
+    # bare uuids too, but always with an expiry.
+    async with redis_client.pipeline(transaction=False) as pipeline:
+        for key in keys:
+            pipeline.ttl(key)
+            pipeline.type(key)
+        results = await pipeline.execute()
+    candidates = [
+        key
+        for key, ttl, key_type in zip(keys, results[::2], results[1::2])
+        if ttl == -1 and key_type == b"string"
+    ]
+    if not candidates:
+        return 0
+    values = await redis_client.mget(candidates)
+    legacy_keys = [
+        key
+        for key, value in zip(candidates, values)
+        if value is not None and is_legacy_party_state(value)
+    ]
+    if not legacy_keys:
+        return 0
+    return await redis_client.unlink(*legacy_keys)
+
+
+async def sweep_legacy_party_keys(redis_client: aioredis.Redis) -> int:
+    # Party state used to be a JSON string under the bare party id with no
+    # expiry. One worker per deploy removes those leftovers.
+    if not await redis_client.set(
+        SWEEP_LOCK_KEY, 1, nx=True, ex=settings.party_state_ttl
+    ):
+        return 0
+    swept = 0
+    cursor = 0
+    try:
+        while True:
+            cursor, keys = await redis_client.scan(
+                cursor, match="*-*-*-*-*", count=1000
+            )
+            keys = [key for key in keys if is_uuid(key)]
+            if keys:
+                swept += await unlink_legacy_keys(redis_client, keys)
+            if cursor == 0:
+                break
+    except Exception as e:
+        print(e)
+    return swept
+
+
+async def main() -> None:
+    redis_client = aioredis.Redis(
+        host=settings.redis_host, port=settings.redis_port
+    )
+    await redis_client.delete(SWEEP_LOCK_KEY)
+    print(f"swept {await sweep_legacy_party_keys(redis_client)} keys")
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -5,19 +5,20 @@ from faststream.rabbit import (
     RabbitQueue,
 )
 
+PARTY_MANAGER_EXCHANGE = "party-manager-service"
+PARTY_CREATION_QUEUE = "party-manager-service.party_creation"
+
 rabbitmq_broker: RabbitBroker | None = None
 
 
 async def configure_rabbit_exchange():
     await rabbitmq_broker.declare_exchange(
-        RabbitExchange(name="party-manager-service", type=ExchangeType.FANOUT)
+        RabbitExchange(name=PARTY_MANAGER_EXCHANGE, type=ExchangeType.FANOUT)
     )
 
 
 async def configure_rabbit_queues():
-    await rabbitmq_broker.declare_queue(
-        RabbitQueue(name="party-manager-service.party_creation")
-    )
+    await rabbitmq_broker.declare_queue(RabbitQueue(name=PARTY_CREATION_QUEUE))
 
 
 def get_rabbitmq() -> RabbitBroker:
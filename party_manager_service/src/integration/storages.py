@@ -12,13 +12,21 @@ from .mongodb import get_mongo_client
 class IStorage(ABC):
     @abstractmethod
     async def find_element_by_properties(
-        self, properties: dict, collection_name: str
+        self,
+        properties: dict,
+        collection_name: str,
+        projection: dict | None = None,
     ) -> Any:
         pass
 
     @abstractmethod
     async def find_elements_by_properties(
-        self, properties: dict, collection_name: str
+        self,
+        properties: dict,
+        collection_name: str,
+        sort: list[tuple[str, int]] | None = None,
+        limit: int | None = None,
+        projection: dict | None = None,
     ) -> list[Any]:
         pass
 
@@ -29,29 +37,52 @@ class IStorage(ABC):
         pass
 
     @abstractmethod
-    async def update_element(
-        self, find_property: dict, update_property: dict, collection_name: str
+    async def insert_elements(
+        self, elements: list[dict], collection_name: str
     ) -> None:
         pass
 
+    @abstractmethod
+    async def update_element(
+        self,
+        find_property: dict,
+        update_property: dict,
+        collection_name: str,
+        upsert: bool = False,
+    ) -> bool:
+        pass
+
 
 class MongoStorage(IStorage):
     def __init__(self, client: AsyncIOMotorClient, database_name: str):
         self.database_client = client[database_name]
 
     async def find_element_by_properties(
-        self, properties: dict, collection_name: str
+        self,
+        properties: dict,
+        collection_name: str,
+        projection: dict | None = None,
     ) -> Any:
-        return await self.database_client[collection_name].find_one(properties)
+        return await self.database_client[collection_name].find_one(
+            properties, projection
+        )
 
     async def find_elements_by_properties(
-        self, properties: dict, collection_name: str
+        self,
+        properties: dict,
+        collection_name: str,
+        sort: list[tuple[str, int]] | None = None,
+        limit: int | None = None,
+        projection: dict | None = None,
     ) -> list[Any]:
-        return (
-            await self.database_client[collection_name]
-            .find(properties)
-            .to_list(length=None)
+        cursor = self.database_client[collection_name].find(
+            properties, projection
         )
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
 
     async def insert_element(
         self, element: dict, collection_name: str
@@ -64,11 +95,16 @@ class MongoStorage(IStorage):
         await self.database_client[collection_name].insert_many(elements)
 
     async def update_element(
-        self, find_property: dict, update_property: dict, collection_name: str
-    ) -> None:
-        await self.database_client[collection_name].update_one(
-            find_property, update_property
+        self,
+        find_property: dict,
+        update_property: dict,
+        collection_name: str,
+        upsert: bool = False,
+    ) -> bool:
+        result = await self.database_client[collection_name].update_one(
+            find_property, update_property, upsert=upsert
         )
+        return result.matched_count > 0 or result.upserted_id is not None
 
 
 @lru_cache
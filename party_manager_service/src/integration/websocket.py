@@ -1,29 +1,530 @@
+import asyncio
+import contextlib
+import random
+import time
 import uuid
-from collections import defaultdict
+from collections import deque
 from functools import lru_cache
+from typing import Callable, Iterator
 
-from fastapi import WebSocket
+from core.config import settings
+from core.encoders import dumps, loads, msgpack, packb
+from core.metrics import metrics
+from core.ratelimit import TokenBucket
+from fastapi import WebSocket, status
+from integration.redis import get_redis_client
+from redis.asyncio.client import PubSub
+
+COALESCIBLE_MESSAGE_TYPES = frozenset({"sync", "timeupdate", "seeked"})
+
+JSON_SUBPROTOCOL = "party.json.v1"
+MSGPACK_SUBPROTOCOL = "party.msgpack.v1"
+
+
+def select_subprotocol(offered: list[str]) -> str | None:
+    if MSGPACK_SUBPROTOCOL in offered and msgpack is not None:
+        return MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON_SUBPROTOCOL
+    return None
+
+
+class OutboundFrame:
+    __slots__ = ("message_type", "message", "data", "packed", "enqueued_at")
+
+    def __init__(
+        self, message_type: str | None, data: str, message: dict | None = None
+    ):
+        self.message_type = message_type
+        self.message = message
+        self.data = data
+        self.packed: bytes | None = None
+        self.enqueued_at = time.monotonic()
+
+    def get_packed(self) -> bytes:
+        # Packed lazily and once, so JSON-only parties never pay for it and
+        # binary sockets share the encoding like they share the JSON one.
+        if self.packed is None:
+            if self.message is None:
+                self.message = loads(self.data)
+            self.packed = packb(self.message)
+        return self.packed
+
+    @classmethod
+    def from_message(cls, message: dict) -> "OutboundFrame":
+        return cls(message.get("type"), dumps(message), message)
+
+
+class WebSocketConnection:
+    __slots__ = (
+        "party_id",
+        "websocket",
+        "router",
+        "user",
+        "binary",
+        "buckets",
+        "strikes",
+        "outbox",
+        "outbox_ready",
+        "stalled_since",
+        "evicted",
+        "close_code",
+        "writer",
+    )
+
+    def __init__(
+        self,
+        party_id: uuid.UUID,
+        websocket: WebSocket,
+        router: "WebSocketRouter",
+        user: str | None = None,
+        binary: bool = False,
+    ):
+        self.party_id = party_id
+        self.websocket = websocket
+        self.router = router
+        self.user = user
+        self.binary = binary
+        self.buckets: dict[str, TokenBucket] = {}
+        self.strikes = TokenBucket(*settings.websocket_rate_limit_strikes)
+        self.outbox: deque[OutboundFrame] = deque()
+        self.outbox_ready = asyncio.Event()
+        self.stalled_since: float | None = None
+        self.evicted = False
+        self.close_code: int | None = None
+        self.writer = asyncio.create_task(self.write_outbox())
+
+    def send(self, message: dict) -> None:
+        self.enqueue(OutboundFrame.from_message(message))
+
+    def enqueue(self, frame: OutboundFrame) -> None:
+        if len(self.outbox) >= settings.websocket_outbox_size:
+            if not self.make_room(frame):
+                self.reject(frame)
+                return
+        self.outbox.append(frame)
+        self.outbox_ready.set()
+
+    def make_room(self, frame: OutboundFrame) -> bool:
+        # Playback positions are stale as soon as a newer one is queued, so
+        # a full outbox sheds them first to make room for control frames.
+        if frame.message_type in COALESCIBLE_MESSAGE_TYPES:
+            for queued in self.outbox:
+                if queued.message_type == frame.message_type:
+                    self.outbox.remove(queued)
+                    return True
+        for queued in self.outbox:
+            if queued.message_type in COALESCIBLE_MESSAGE_TYPES:
+                self.outbox.remove(queued)
+                return True
+        return False
+
+    def get_buckets(
+        self, message_type: str | None
+    ) -> tuple[str, TokenBucket, TokenBucket | None]:
+        limits = settings.websocket_rate_limits
+        limit_key = message_type if message_type in limits else "default"
+        bucket = self.buckets.get(limit_key)
+        if bucket is None:
+            bucket = self.buckets[limit_key] = TokenBucket(*limits[limit_key])
+        party_bucket = self.router.get_party_bucket(self.party_id, limit_key)
+        return limit_key, bucket, party_bucket
+
+    def take_token(self, message_type: str | None) -> bool:
+        _, bucket, party_bucket = self.get_buckets(message_type)
+        now = time.monotonic()
+        if bucket.has_token(now) and (
+            party_bucket is None or party_bucket.has_token(now)
+        ):
+            bucket.take()
+            if party_bucket is not None:
+                party_bucket.take()
+            return True
+        return False
+
+    def admit(self, message_type: str | None) -> bool:
+        if self.evicted:
+            return False
+        if self.take_token(message_type):
+            return True
+
+        limit_key, _, _ = self.get_buckets(message_type)
+        metrics.increment(
+            "websocket_rate_limited_frames_total", type=limit_key
+        )
+        if not self.strikes.consume(time.monotonic()):
+            metrics.increment("websocket_rate_limit_closes_total")
+            self.evict(status.WS_1008_POLICY_VIOLATION)
+        return False
+
+    def retry_after(self, message_type: str | None) -> float:
+        _, bucket, party_bucket = self.get_buckets(message_type)
+        if party_bucket is None:
+            return bucket.retry_after()
+        return max(bucket.retry_after(), party_bucket.retry_after())
+
+    def reject(self, frame: OutboundFrame) -> None:
+        metrics.increment(
+            "websocket_dropped_frames_total", type=frame.message_type
+        )
+        # Only a playback position may be lost; a socket that cannot take a
+        # control frame is closed, and the client resumes from its last_seq.
+        if frame.message_type not in COALESCIBLE_MESSAGE_TYPES:
+            self.evict()
+            return
+        now = time.monotonic()
+        if self.stalled_since is None:
+            self.stalled_since = now
+        elif now - self.stalled_since > settings.websocket_send_timeout:
+            self.evict()
+
+    async def write_outbox(self) -> None:
+        while True:
+            await self.outbox_ready.wait()
+            while self.outbox:
+                frame = self.outbox.popleft()
+                if self.binary:
+                    send = self.websocket.send_bytes(frame.get_packed())
+                else:
+                    send = self.websocket.send_text(frame.data)
+                try:
+                    await asyncio.wait_for(
+                        send, timeout=settings.websocket_send_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.evict()
+                    return
+                except Exception:
+                    return
+                self.stalled_since = None
+                metrics.observe(
+                    "websocket_broadcast_latency_seconds",
+                    time.monotonic() - frame.enqueued_at,
+                    party_id=self.party_id,
+                )
+            self.outbox_ready.clear()
+            if self.close_code is not None:
+                await self.close(self.close_code)
+                return
+
+    def request_close(self, code: int) -> None:
+        # Closes the socket once everything queued before has been sent.
+        self.close_code = code
+        self.outbox_ready.set()
+
+    def evict(self, code: int = status.WS_1013_TRY_AGAIN_LATER) -> None:
+        if self.evicted:
+            return
+        self.evicted = True
+        metrics.increment("websocket_evicted_connections_total")
+        self.router.remove_connection(self.party_id, self.websocket)
+        asyncio.create_task(self.close(code))
+
+    async def close(self, code: int) -> None:
+        with contextlib.suppress(Exception):
+            await asyncio.wait_for(
+                self.websocket.close(code=code),
+                timeout=settings.websocket_send_timeout,
+            )
 
 
 class WebSocketRouter:
-    def __init__(self):
-        self.connections: dict[uuid.UUID, list[WebSocket]] = defaultdict(list)
+    def __init__(self, name: str):
+        self.name = name
+        # Dicts keep insertion order and remove a socket in O(1); a party's
+        # entry is dropped together with its last socket.
+        self.connections: dict[
+            uuid.UUID, dict[WebSocket, WebSocketConnection]
+        ] = {}
+        self.connections_count = 0
+        self.on_remote_frame: (
+            Callable[[uuid.UUID, OutboundFrame], None] | None
+        ) = None
+        self.party_buckets: dict[uuid.UUID, dict[str, TokenBucket]] = {}
+
+    def __len__(self) -> int:
+        return self.connections_count
+
+    def __iter__(self) -> Iterator[WebSocketConnection]:
+        for connections in list(self.connections.values()):
+            yield from list(connections.values())
+
+    def stats(self) -> dict:
+        return {
+            "parties": len(self.connections),
+            "connections": self.connections_count,
+        }
+
+    def get_party_ids(self) -> list[uuid.UUID]:
+        return list(self.connections)
+
+    def get_connections(self, _id: uuid.UUID) -> list[WebSocketConnection]:
+        connections = self.connections.get(_id)
+        return list(connections.values()) if connections else []
+
+    def has_connection(
+        self, _id: uuid.UUID, connection: WebSocketConnection
+    ) -> bool:
+        connections = self.connections.get(_id)
+        return (
+            connections is not None
+            and connections.get(connection.websocket) is connection
+        )
 
     def get_websocket_by_party_id(self, _id: uuid.UUID) -> list[WebSocket]:
-        return self.connections[_id]
+        return list(self.connections.get(_id, ()))
+
+    def get_connections_by_user(
+        self, _id: uuid.UUID, user: str
+    ) -> list[WebSocketConnection]:
+        return [
+            connection
+            for connection in self.get_connections(_id)
+            if connection.user == user
+        ]
 
-    def add_connection(self, _id: uuid.UUID, websocket: WebSocket):
-        self.connections[_id].append(websocket)
+    def get_party_bucket(
+        self, _id: uuid.UUID, limit_key: str
+    ) -> TokenBucket | None:
+        limit = settings.websocket_party_rate_limits.get(limit_key)
+        if limit is None:
+            return None
+        buckets = self.party_buckets.setdefault(_id, {})
+        bucket = buckets.get(limit_key)
+        if bucket is None:
+            bucket = buckets[limit_key] = TokenBucket(*limit)
+        return bucket
+
+    def add_connection(
+        self,
+        _id: uuid.UUID,
+        websocket: WebSocket,
+        user: str | None = None,
+        binary: bool = False,
+    ) -> WebSocketConnection:
+        connection = WebSocketConnection(_id, websocket, self, user, binary)
+        self.connections.setdefault(_id, {})[websocket] = connection
+        self.connections_count += 1
+        self.report_stats()
+        return connection
 
     def remove_connection(self, _id: uuid.UUID, websocket: WebSocket) -> None:
-        self.connections[_id].remove(websocket)
+        connections = self.connections.get(_id)
+        if connections is None:
+            return
+        connection = connections.pop(websocket, None)
+        if connection is None:
+            return
+        connection.writer.cancel()
+        self.connections_count -= 1
+        if not connections:
+            del self.connections[_id]
+            self.party_buckets.pop(_id, None)
+            metrics.discard(party_id=_id)
+        self.report_stats()
+
+    def report_stats(self) -> None:
+        metrics.set_gauge(
+            "websocket_parties", len(self.connections), router=self.name
+        )
+        metrics.set_gauge(
+            "websocket_connections", self.connections_count, router=self.name
+        )
+
+    def broadcast(self, _id: uuid.UUID, message: dict) -> None:
+        self.deliver(_id, OutboundFrame.from_message(message))
+
+    def deliver(self, _id: uuid.UUID, frame: OutboundFrame) -> None:
+        for connection in self.get_connections(_id):
+            connection.enqueue(frame)
+
+    async def close(self) -> None:
+        pass
+
+
+# Broadcasts are delivered to local sockets right away and published to the
+# party channel for other nodes, each of which is subscribed only to the
+# parties it currently has sockets for.
+class RedisWebSocketRouter(WebSocketRouter):
+    def __init__(self, name: str, channel_prefix: str):
+        super().__init__(name)
+        self.channel_prefix = channel_prefix
+        self.node_id = uuid.uuid4().hex
+        self.pubsub: PubSub | None = None
+        self.subscribed = asyncio.Event()
+        self.subscribed_parties: set[uuid.UUID] = set()
+        self.subscription_changes: asyncio.Queue[uuid.UUID] = asyncio.Queue()
+        self.publications: asyncio.Queue[tuple[str, str]] = asyncio.Queue()
+        self.tasks: list[asyncio.Task] = []
+
+    def party_channel(self, _id: uuid.UUID) -> str:
+        return f"{self.channel_prefix}:{_id}"
+
+    def start(self) -> None:
+        if self.pubsub is not None:
+            return
+        self.pubsub = get_redis_client().pubsub()
+        self.tasks = [
+            asyncio.create_task(self.apply_subscription_changes()),
+            asyncio.create_task(self.publish_frames()),
+            asyncio.create_task(self.listen()),
+        ]
+
+    def add_connection(
+        self,
+        _id: uuid.UUID,
+        websocket: WebSocket,
+        user: str | None = None,
+        binary: bool = False,
+    ) -> WebSocketConnection:
+        self.start()
+        connection = super().add_connection(_id, websocket, user, binary)
+        if len(self.connections[_id]) == 1:
+            self.subscription_changes.put_nowait(_id)
+        return connection
+
+    def remove_connection(self, _id: uuid.UUID, websocket: WebSocket) -> None:
+        was_local = _id in self.connections
+        super().remove_connection(_id, websocket)
+        if was_local and _id not in self.connections:
+            self.subscription_changes.put_nowait(_id)
+
+    def broadcast(self, _id: uuid.UUID, message: dict) -> None:
+        frame = OutboundFrame.from_message(message)
+        self.deliver(_id, frame)
+        self.publish(self.party_channel(_id), frame)
+
+    def publish(self, channel: str, frame: OutboundFrame) -> None:
+        self.start()
+        self.publications.put_nowait(
+            (
+                channel,
+                f"{self.node_id}|{frame.message_type or ''}|{frame.data}",
+            )
+        )
+
+    async def publish_frames(self) -> None:
+        redis_client = get_redis_client()
+        while True:
+            publications = [await self.publications.get()]
+            while not self.publications.empty():
+                publications.append(self.publications.get_nowait())
+            # A single task keeps the per-party event order; everything
+            # queued meanwhile goes out in one pipeline round-trip.
+            async with redis_client.pipeline(transaction=False) as pipeline:
+                for channel, envelope in publications:
+                    pipeline.publish(channel, envelope)
+                try:
+                    await pipeline.execute()
+                except Exception as e:
+                    print(e)
+
+    async def apply_subscription_changes(self) -> None:
+        while True:
+            _id = await self.subscription_changes.get()
+            # Membership is re-checked here, so a party that was joined and
+            # left before this change was applied needs no round-trip.
+            is_local = bool(self.connections.get(_id))
+            try:
+                if is_local and _id not in self.subscribed_parties:
+                    await self.pubsub.subscribe(self.party_channel(_id))
+                    self.subscribed_parties.add(_id)
+                    self.subscribed.set()
+                elif not is_local and _id in self.subscribed_parties:
+                    await self.pubsub.unsubscribe(self.party_channel(_id))
+                    self.subscribed_parties.discard(_id)
+            except Exception as e:
+                print(e)
+
+    async def listen(self) -> None:
+        await self.subscribed.wait()
+        while True:
+            try:
+                message = await self.pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+            except Exception as e:
+                print(e)
+                await asyncio.sleep(1.0)
+                continue
+            if message is not None:
+                self.deliver_remote(message["channel"], message["data"])
+
+    def deliver_remote(self, channel: bytes, envelope: bytes) -> None:
+        node_id, message_type, data = envelope.decode("utf-8").split("|", 2)
+        if node_id == self.node_id:
+            return
+        frame = OutboundFrame(message_type or None, data)
+        party_id = uuid.UUID(
+            channel.decode("utf-8").removeprefix(f"{self.channel_prefix}:")
+        )
+        if self.on_remote_frame is not None:
+            self.on_remote_frame(party_id, frame)
+        self.deliver(party_id, frame)
+
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+
+
+async def drain_connections(routers: list[WebSocketRouter]) -> None:
+    connections = [connection for router in routers for connection in router]
+    if not connections:
+        return
+    random.shuffle(connections)
+    waves = [
+        connections[i : i + settings.drain_wave_size]
+        for i in range(0, len(connections), settings.drain_wave_size)
+    ]
+    deadline = time.monotonic() + settings.drain_timeout
+    for index, wave in enumerate(waves):
+        for connection in wave:
+            connection.send(
+                {
+                    "type": "reconnect",
+                    "after": round(
+                        random.uniform(0, settings.drain_reconnect_jitter), 3
+                    ),
+                }
+            )
+            connection.request_close(status.WS_1012_SERVICE_RESTART)
+        metrics.increment("websocket_drained_connections_total", len(wave))
+        # Every wave gets an equal share of the time left, so sockets that
+        # are slow to flush cannot push the drain past drain_timeout.
+        started = time.monotonic()
+        budget = max(deadline - started, 0) / (len(waves) - index)
+        await asyncio.wait(
+            [connection.writer for connection in wave],
+            timeout=min(settings.websocket_send_timeout, budget),
+        )
+        for connection in wave:
+            connection.router.remove_connection(
+                connection.party_id, connection.websocket
+            )
+        if index < len(waves) - 1:
+            await asyncio.sleep(
+                min(
+                    settings.drain_wave_interval,
+                    max(budget - (time.monotonic() - started), 0),
+                )
+            )
+
+
+def create_websocket_router(name: str) -> WebSocketRouter:
+    if settings.websocket_router_mode == "redis":
+        return RedisWebSocketRouter(
+            name, f"{settings.websocket_channel_prefix}:{name}"
+        )
+    return WebSocketRouter(name)
 
 
 @lru_cache(maxsize=1)
 def get_stream_websocket_router() -> WebSocketRouter:
-    return WebSocketRouter()
+    return create_websocket_router("stream")
 
 
 @lru_cache(maxsize=1)
 def get_chat_websocket_router() -> WebSocketRouter:
-    return WebSocketRouter()
+    return create_websocket_router("chat")
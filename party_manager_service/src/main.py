@@ -1,14 +1,43 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 import redis.asyncio as aioredis
 import uvicorn
-from api.v1 import film, stream, websockets
+from api.v1 import (
+    affinity,
+    drain,
+    film,
+    matchmaking,
+    metrics,
+    presence,
+    stream,
+    websockets,
+)
 from core.config import settings
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from faststream.rabbit import RabbitBroker
-from integration import mongodb, rabbitmq, redis
+from integration import (
+    indexes,
+    legacy_party_keys,
+    mongodb,
+    rabbitmq,
+    redis,
+    websocket,
+)
+from integration.brokers import get_message_broker
+from integration.cache import get_cache
+from integration.storages import get_storage
 from motor.motor_asyncio import AsyncIOMotorClient
+from services.admission import get_connection_admission_service
+from services.affinity import get_worker_registry
+from services.broker import get_party_manager_service
+from services.chat import get_chat_history_service
+from services.drain import get_drain_service
+from services.party_creation import get_party_creation_batcher
+from services.playback import get_playback_state_store
+from services.presence import get_presence_service
+from services.votes import get_kick_vote_service
 
 
 @asynccontextmanager
@@ -19,6 +48,7 @@ async def lifespan(app: FastAPI):
         port=settings.rabbitmq_port,
         login=settings.rabbitmq_login,
         password=settings.rabbitmq_password,
+        max_consumers=settings.party_creation_prefetch,
     )
     redis.redis_client = aioredis.Redis(
         host=settings.redis_host, port=settings.redis_port
@@ -26,7 +56,57 @@ async def lifespan(app: FastAPI):
     await rabbitmq.rabbitmq_broker.connect()
     await rabbitmq.configure_rabbit_queues()
     await rabbitmq.configure_rabbit_exchange()
+    # Dependencies are resolved with keyword arguments, and lru_cache keys
+    # positional calls apart from them, so the same instances are only
+    # shared with the endpoints when they are built the same way here.
+    redis_client = redis.redis_client
+    storage = get_storage(client=mongodb.mongo_client)
+    playback_store = get_playback_state_store(
+        cache=get_cache(redis_client=redis_client)
+    )
+    chat_history = get_chat_history_service(storage=storage)
+    presence = get_presence_service(redis_client=redis_client)
+    party_creation_batcher = get_party_creation_batcher(
+        party_manager_service=get_party_manager_service(storage=storage),
+        broker=get_message_broker(broker=rabbitmq.rabbitmq_broker),
+    )
+    rabbitmq.rabbitmq_broker.subscriber(
+        rabbitmq.PARTY_CREATION_QUEUE, retry=settings.party_creation_retries
+    )(party_creation_batcher.consume)
+    await rabbitmq.rabbitmq_broker.start()
+    await indexes.apply_indexes(
+        mongodb.mongo_client[settings.mongodb_database_name]
+    )
+    worker_registry = get_worker_registry(redis_client=redis_client)
+    await worker_registry.start()
+    legacy_sweep = asyncio.create_task(
+        legacy_party_keys.sweep_legacy_party_keys(redis_client)
+    )
     yield
+    legacy_sweep.cancel()
+    # Parties move to other workers first; the playback clocks are then
+    # flushed to Redis, where their new owners pick them up.
+    await get_drain_service(
+        registry=worker_registry,
+        stream_router=websocket.get_stream_websocket_router(),
+        chat_router=websocket.get_chat_websocket_router(),
+        playback_store=playback_store,
+        chat_history=chat_history,
+    ).drain()
+    await playback_store.close()
+    await chat_history.close()
+    await party_creation_batcher.close()
+    await get_connection_admission_service(redis_client=redis_client).close()
+    await presence.close()
+    await worker_registry.close()
+    get_kick_vote_service(
+        redis_client=redis_client,
+        chat_router=websocket.get_chat_websocket_router(),
+        stream_router=websocket.get_stream_websocket_router(),
+        presence=presence,
+    ).close()
+    await websocket.get_stream_websocket_router().close()
+    await websocket.get_chat_websocket_router().close()
     await redis.redis_client.close()
     await rabbitmq.rabbitmq_broker.close()
     mongodb.mongo_client.close()
@@ -49,17 +129,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(
+    affinity.router,
+    prefix="/party-manager-service/api/v1/affinity",
+    tags=["Affinity"],
+)
+app.include_router(
+    drain.router,
+    prefix="/party-manager-service/api/v1/drain",
+    tags=["Drain"],
+)
 app.include_router(
     film.router,
     prefix="/party-manager-service/api/v1/broker",
     tags=["RabbitMQ"],
 )
+app.include_router(
+    matchmaking.router,
+    prefix="/party-manager-service/api/v1/matchmaking",
+    tags=["Matchmaking"],
+)
+app.include_router(
+    presence.router,
+    prefix="/party-manager-service/api/v1/presence",
+    tags=["Presence"],
+)
 app.include_router(
     stream.router, prefix="/party-manager-service/api/v1/stream", tags=["HLS"]
 )
 app.include_router(
     websockets.router, prefix="/party-manager-service", tags=["WebSockets"]
 )
+app.include_router(
+    metrics.router,
+    prefix="/party-manager-service/api/v1/metrics",
+    tags=["Metrics"],
+)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
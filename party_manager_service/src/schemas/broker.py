@@ -6,3 +6,10 @@ from pydantic import BaseModel
 class PartyCreationMessage(BaseModel):
     film_id: uuid.UUID
     users_ids: list[uuid.UUID]
+
+
+class PartyCreatedMessage(BaseModel):
+    party_id: uuid.UUID
+    film_id: uuid.UUID
+    users_ids: list[uuid.UUID]
+    redirect_url: str
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from functools import lru_cache
+from typing import Annotated
+
+import redis.asyncio as aioredis
+from core.config import settings
+from core.metrics import metrics
+from fastapi import Depends
+from integration.redis import get_redis_client
+
+DEVICES_KEY_PREFIX = "admission:devices:"
+
+# KEYS: user devices
+# ARGV: device id, now, lease ttl, devices limit
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return -1
+end
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[4]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])))
+return 1
+"""
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class ConnectionAdmissionService:
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis_client = redis_client
+        self.acquire_script = redis_client.register_script(ACQUIRE_SCRIPT)
+        self.leases: set[tuple[str, str]] = set()
+        self.heartbeat: asyncio.Task | None = None
+
+    async def acquire(self, user_id: str, device_id: str) -> None:
+        result = await self.acquire_script(
+            keys=[f"{DEVICES_KEY_PREFIX}{user_id}"],
+            args=[
+                device_id,
+                time.time(),
+                settings.admission_lease_ttl,
+                settings.admission_max_devices,
+            ],
+        )
+        if result == -1:
+            metrics.increment(
+                "admission_rejected_connections_total", reason="device"
+            )
+            raise AdmissionRejected("Device is already streaming")
+        if result == 0:
+            metrics.increment(
+                "admission_rejected_connections_total", reason="devices_limit"
+            )
+            raise AdmissionRejected("Too many devices")
+
+        self.leases.add((user_id, device_id))
+        metrics.set_gauge("admission_leases", len(self.leases))
+        if self.heartbeat is None:
+            self.heartbeat = asyncio.create_task(self.renew_periodically())
+
+    async def release(self, user_id: str, device_id: str) -> None:
+        self.leases.discard((user_id, device_id))
+        metrics.set_gauge("admission_leases", len(self.leases))
+        try:
+            await self.redis_client.zrem(
+                f"{DEVICES_KEY_PREFIX}{user_id}", device_id
+            )
+        except Exception as e:
+            print(e)
+
+    async def renew(self) -> None:
+        if not self.leases:
+            return
+        expires_at = time.time() + settings.admission_lease_ttl
+        # XX only extends leases that are still held, so a slot that was
+        # already reaped is not resurrected behind the limit check.
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            for user_id, device_id in list(self.leases):
+                key = f"{DEVICES_KEY_PREFIX}{user_id}"
+                pipeline.zadd(key, {device_id: expires_at}, xx=True)
+                pipeline.expire(key, int(settings.admission_lease_ttl) + 1)
+            await pipeline.execute()
+
+    async def renew_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(settings.admission_heartbeat_interval)
+            try:
+                await self.renew()
+            except Exception as e:
+                print(e)
+
+    async def close(self) -> None:
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+        leases = list(self.leases)
+        self.leases.clear()
+        if not leases:
+            return
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            for user_id, device_id in leases:
+                pipeline.zrem(f"{DEVICES_KEY_PREFIX}{user_id}", device_id)
+            await pipeline.execute()
+
+
+@lru_cache
+def get_connection_admission_service(
+    redis_client: Annotated[aioredis.Redis, Depends(get_redis_client)],
+) -> ConnectionAdmissionService:
+    return ConnectionAdmissionService(redis_client)
@@ -0,0 +1,128 @@
+import asyncio
+import socket
+import time
+import uuid
+from functools import lru_cache
+from typing import Annotated
+
+import redis.asyncio as aioredis
+from core.config import settings
+from core.hashring import HashRing
+from fastapi import Depends
+from integration.redis import get_redis_client
+
+WORKERS_KEY = "affinity:workers"
+ADDRESSES_KEY = "affinity:addresses"
+DRAINING_KEY = "affinity:draining"
+
+
+class WorkerRegistry:
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis_client = redis_client
+        hostname = socket.gethostname()
+        self.worker_id = settings.affinity_worker_id or hostname
+        self.address = settings.affinity_worker_address or f"{hostname}:8000"
+        self.addresses: dict[str, str] = {self.worker_id: self.address}
+        self.ring = HashRing([self.worker_id], settings.affinity_ring_replicas)
+        self.draining = False
+        self.heartbeat: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if not settings.affinity_enabled or self.heartbeat is not None:
+            return
+        # nginx can only address a container, and every gunicorn worker in
+        # it would claim the same id and own the same parties.
+        if settings.gunicorn_workers > 1:
+            raise RuntimeError(
+                "AFFINITY_ENABLED needs GUNICORN_WORKERS=1; scale the "
+                "service with more containers instead"
+            )
+        await self.beat()
+        self.heartbeat = asyncio.create_task(self.beat_periodically())
+
+    async def beat(self) -> None:
+        now = time.time()
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.zadd(WORKERS_KEY, {self.worker_id: now})
+            pipeline.hset(ADDRESSES_KEY, self.worker_id, self.address)
+            pipeline.zremrangebyscore(
+                WORKERS_KEY, "-inf", now - settings.affinity_worker_ttl
+            )
+            pipeline.zrange(WORKERS_KEY, 0, -1)
+            pipeline.smembers(DRAINING_KEY)
+            pipeline.hgetall(ADDRESSES_KEY)
+            *_, workers, draining, addresses = await pipeline.execute()
+
+        workers = [worker_id.decode("utf-8") for worker_id in workers]
+        addresses = {
+            worker_id.decode("utf-8"): address.decode("utf-8")
+            for worker_id, address in addresses.items()
+        }
+        self.addresses = {
+            worker_id: addresses[worker_id]
+            for worker_id in workers
+            if worker_id in addresses
+        }
+        draining = {worker_id.decode("utf-8") for worker_id in draining}
+        self.rebuild_ring(
+            [worker_id for worker_id in workers if worker_id not in draining]
+        )
+
+    def rebuild_ring(self, workers: list[str]) -> None:
+        if self.draining and self.worker_id in workers:
+            workers.remove(self.worker_id)
+        if not workers:
+            workers = [self.worker_id]
+        # Rebuilding is skipped unless membership changed, so steady
+        # heartbeats cost no allocations.
+        if self.ring.nodes != frozenset(workers):
+            self.ring = HashRing(workers, settings.affinity_ring_replicas)
+
+    async def beat_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(settings.affinity_heartbeat_interval)
+            try:
+                await self.beat()
+            except Exception as e:
+                print(e)
+
+    def get_owner(self, party_id: uuid.UUID) -> str:
+        return self.ring.get_node(str(party_id))
+
+    def owns(self, party_id: uuid.UUID) -> bool:
+        if not settings.affinity_enabled:
+            return True
+        return self.get_owner(party_id) == self.worker_id
+
+    async def drain(self) -> None:
+        self.draining = True
+        self.rebuild_ring(list(self.ring.nodes))
+        if settings.affinity_enabled:
+            await self.redis_client.sadd(DRAINING_KEY, self.worker_id)
+
+    def render_nginx_map(self) -> str:
+        lines = [
+            "map $arg_worker $party_manager_upstream {",
+            f"    default {settings.affinity_default_upstream};",
+        ]
+        for worker_id in sorted(self.addresses):
+            lines.append(f"    {worker_id} {self.addresses[worker_id]};")
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    async def close(self) -> None:
+        if self.heartbeat is None:
+            return
+        self.heartbeat.cancel()
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.zrem(WORKERS_KEY, self.worker_id)
+            pipeline.hdel(ADDRESSES_KEY, self.worker_id)
+            pipeline.srem(DRAINING_KEY, self.worker_id)
+            await pipeline.execute()
+
+
+@lru_cache
+def get_worker_registry(
+    redis_client: Annotated[aioredis.Redis, Depends(get_redis_client)],
+) -> WorkerRegistry:
+    return WorkerRegistry(redis_client)
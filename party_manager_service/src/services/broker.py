@@ -2,18 +2,36 @@ import uuid
 from functools import lru_cache
 from typing import Annotated
 
+from core.config import settings
+from core.lru import TTLLRUCache
 from fastapi import Depends
 from integration.storages import IStorage, get_storage
 from schemas.broker import PartyCreationMessage
 
+PARTY_METADATA_PROJECTION = {
+    "_id": 0,
+    "party_id": 1,
+    "film_id": 1,
+    "users_ids": 1,
+}
+
 
 class PartyManagerService:
     def __init__(self, storage: IStorage):
         self.storage = storage
+        self.metadata_cache = TTLLRUCache(
+            settings.party_metadata_cache_size,
+            settings.party_metadata_cache_ttl,
+        )
 
     async def create_party(self, party_creation_message: PartyCreationMessage):
-        party_id = uuid.uuid4()
-        await self.storage.insert_element(
+        return (await self.create_parties([party_creation_message]))[0]
+
+    async def create_parties(
+        self, party_creation_messages: list[PartyCreationMessage]
+    ) -> list[uuid.UUID]:
+        parties_ids = [uuid.uuid4() for _ in party_creation_messages]
+        parties = [
             {
                 "party_id": str(party_id),
                 "film_id": str(party_creation_message.film_id),
@@ -21,20 +39,42 @@ class PartyManagerService:
                     str(user_id)
                     for user_id in party_creation_message.users_ids
                 ],
-                "messages": [],
-            },
-            "parties",
-        )
-        return party_id
+            }
+            for party_id, party_creation_message in zip(
+                parties_ids, party_creation_messages
+            )
+        ]
+        await self.storage.insert_elements(parties, "parties")
+        for party_id, party in zip(parties_ids, parties):
+            self.metadata_cache.set(
+                party_id,
+                {
+                    key: party[key]
+                    for key in ("party_id", "film_id", "users_ids")
+                },
+            )
+        return parties_ids
 
-    async def find_party_by_id(self, party_id: uuid.UUID) -> dict:
+    async def find_party_by_id(
+        self, party_id: uuid.UUID, projection: dict | None = None
+    ) -> dict:
         try:
             return await self.storage.find_element_by_properties(
-                {"party_id": str(party_id)}, "parties"
+                {"party_id": str(party_id)}, "parties", projection
             )
         except Exception as e:
             print(e)
 
+    async def get_party_metadata(self, party_id: uuid.UUID) -> dict | None:
+        metadata = self.metadata_cache.get(party_id)
+        if metadata is None:
+            metadata = await self.find_party_by_id(
+                party_id, projection=PARTY_METADATA_PROJECTION
+            )
+            if metadata:
+                self.metadata_cache.set(party_id, metadata)
+        return metadata
+
 
 @lru_cache
 def get_party_manager_service(
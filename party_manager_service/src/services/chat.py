@@ -0,0 +1,248 @@
+import asyncio
+import contextlib
+import itertools
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Annotated
+
+from bson import ObjectId
+from core.config import settings
+from core.lru import TTLLRUCache
+from core.metrics import metrics
+from fastapi import Depends
+from integration.storages import IStorage, get_storage
+
+
+class ChatHistoryService:
+    def __init__(self, storage: IStorage):
+        self.storage = storage
+        self.pending: dict[uuid.UUID, list[dict]] = {}
+        self.in_flight: dict[uuid.UUID, list[dict]] = {}
+        self.current_buckets = TTLLRUCache(
+            settings.chat_bucket_cache_size, settings.chat_bucket_seconds
+        )
+        self.flush_requested = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.flusher: asyncio.Task | None = None
+
+    @staticmethod
+    def create_message(message: dict) -> dict:
+        # ts is taken before the id, so the id's generation time never
+        # falls into an earlier bucket than the message itself.
+        ts = time.time()
+        return {
+            "message_id": str(ObjectId()),
+            "type": message.get("type", "chat"),
+            "text": message["text"],
+            "ts": ts,
+        }
+
+    @staticmethod
+    def get_bucket_start(ts: float) -> datetime:
+        return datetime.fromtimestamp(
+            ts - ts % settings.chat_bucket_seconds, tz=timezone.utc
+        )
+
+    def append(self, party_id: uuid.UUID, message: dict) -> None:
+        party_messages = self.pending.setdefault(party_id, [])
+        party_messages.append(message)
+        if len(party_messages) >= settings.chat_flush_batch_size:
+            self.flush_requested.set()
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self.flush_periodically())
+
+    async def flush_periodically(self) -> None:
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self.flush_requested.wait(),
+                    timeout=settings.chat_flush_interval,
+                )
+            self.flush_requested.clear()
+            await self.flush()
+
+    async def flush(self, party_ids: list[uuid.UUID] | None = None) -> None:
+        async with self.flush_lock:
+            for party_id in list(
+                self.pending if party_ids is None else party_ids
+            ):
+                await self.write_pending(party_id)
+        metrics.set_gauge(
+            "chat_pending_messages",
+            sum(len(messages) for messages in self.pending.values()),
+        )
+
+    async def write_pending(self, party_id: uuid.UUID) -> None:
+        messages = self.pending.pop(party_id, None)
+        if not messages:
+            return
+        self.in_flight[party_id] = messages
+        try:
+            for bucket_start, bucket_messages in itertools.groupby(
+                messages,
+                key=lambda message: self.get_bucket_start(message["ts"]),
+            ):
+                bucket_messages = list(bucket_messages)
+                for offset in range(
+                    0, len(bucket_messages), settings.chat_bucket_size
+                ):
+                    await self.write_bucket(
+                        party_id,
+                        bucket_start,
+                        bucket_messages[
+                            offset : offset + settings.chat_bucket_size
+                        ],
+                    )
+        except Exception as e:
+            self.pending[party_id] = messages + self.pending.get(party_id, [])
+            print(e)
+            return
+        finally:
+            self.in_flight.pop(party_id, None)
+        metrics.observe(
+            "chat_persistence_lag_seconds", time.time() - messages[0]["ts"]
+        )
+        metrics.increment("chat_persisted_messages_total", len(messages))
+
+    async def write_bucket(
+        self, party_id: uuid.UUID, bucket_start: datetime, messages: list[dict]
+    ) -> None:
+        # Only the newest bucket of a window may grow. Appending to an older
+        # bucket that still has room would put later messages before the
+        # ones in the newer bucket, so a full bucket is closed for good.
+        bucket_id = await self.get_current_bucket_id(party_id, bucket_start)
+        if bucket_id is None or not await self.storage.update_element(
+            {
+                "_id": bucket_id,
+                "closed": {"$ne": True},
+                "count": {"$lte": settings.chat_bucket_size - len(messages)},
+            },
+            {
+                "$push": {"messages": {"$each": messages}},
+                "$inc": {"count": len(messages)},
+            },
+            settings.mongodb_chat_collection_name,
+        ):
+            if bucket_id is not None:
+                await self.storage.update_element(
+                    {"_id": bucket_id},
+                    {"$set": {"closed": True}},
+                    settings.mongodb_chat_collection_name,
+                )
+            bucket_id = ObjectId()
+            await self.storage.insert_element(
+                {
+                    "_id": bucket_id,
+                    "party_id": str(party_id),
+                    "ts": bucket_start,
+                    "messages": messages,
+                    "count": len(messages),
+                },
+                settings.mongodb_chat_collection_name,
+            )
+        self.current_buckets.set(party_id, (bucket_start, bucket_id))
+        metrics.increment("chat_persistence_writes_total")
+
+    async def get_current_bucket_id(
+        self, party_id: uuid.UUID, bucket_start: datetime
+    ) -> ObjectId | None:
+        current = self.current_buckets.get(party_id)
+        if current is not None and current[0] == bucket_start:
+            return current[1]
+        buckets = await self.storage.find_elements_by_properties(
+            {
+                "party_id": str(party_id),
+                "ts": bucket_start,
+                "closed": {"$ne": True},
+            },
+            settings.mongodb_chat_collection_name,
+            sort=[("_id", -1)],
+            limit=1,
+            projection={"_id": 1},
+        )
+        return buckets[0]["_id"] if buckets else None
+
+    async def close(self) -> None:
+        if self.flusher is not None:
+            self.flusher.cancel()
+        await self.flush()
+
+    async def get_history(
+        self,
+        party_id: uuid.UUID,
+        before: str | None = None,
+        limit: int | None = None,
+    ) -> tuple[list[dict], bool]:
+        limit = min(
+            limit or settings.chat_history_limit,
+            settings.chat_history_max_limit,
+        )
+        base_conditions = [{"party_id": str(party_id)}]
+        before_id = None
+        if before and ObjectId.is_valid(before):
+            before_id = ObjectId(before)
+            base_conditions.append(
+                {
+                    "ts": {
+                        "$lte": self.get_bucket_start(
+                            before_id.generation_time.timestamp()
+                        )
+                    }
+                }
+            )
+
+        messages = [
+            message
+            for message in self.in_flight.get(party_id, [])
+            + self.pending.get(party_id, [])
+            if before_id is None or ObjectId(message["message_id"]) < before_id
+        ]
+        if len(messages) > limit:
+            return messages[-limit:], True
+        # A batch may land in storage while the buckets are read, so stored
+        # copies of the messages already taken from memory are skipped.
+        unflushed_ids = {message["message_id"] for message in messages}
+
+        conditions = base_conditions
+        while True:
+            buckets = await self.storage.find_elements_by_properties(
+                {"$and": conditions},
+                settings.mongodb_chat_collection_name,
+                sort=[("ts", -1), ("_id", -1)],
+                limit=settings.chat_history_bucket_batch,
+            )
+            for bucket in buckets:
+                messages[:0] = [
+                    message
+                    for message in bucket["messages"]
+                    if message["message_id"] not in unflushed_ids
+                    and (
+                        before_id is None
+                        or ObjectId(message["message_id"]) < before_id
+                    )
+                ]
+                if len(messages) > limit:
+                    return messages[-limit:], True
+            if len(buckets) < settings.chat_history_bucket_batch:
+                return messages, False
+            last_bucket = buckets[-1]
+            conditions = base_conditions + [
+                {
+                    "$or": [
+                        {"ts": {"$lt": last_bucket["ts"]}},
+                        {
+                            "ts": last_bucket["ts"],
+                            "_id": {"$lt": last_bucket["_id"]},
+                        },
+                    ]
+                }
+            ]
+
+
+@lru_cache
+def get_chat_history_service(
+    storage: Annotated[IStorage, Depends(get_storage)],
+) -> ChatHistoryService:
+    return ChatHistoryService(storage)
@@ -0,0 +1,66 @@
+import asyncio
+from functools import lru_cache
+from typing import Annotated
+
+from fastapi import Depends
+from integration.websocket import (
+    WebSocketRouter,
+    drain_connections,
+    get_chat_websocket_router,
+    get_stream_websocket_router,
+)
+from services.affinity import WorkerRegistry, get_worker_registry
+from services.chat import ChatHistoryService, get_chat_history_service
+from services.playback import PlaybackStateStore, get_playback_state_store
+
+
+class DrainService:
+    def __init__(
+        self,
+        registry: WorkerRegistry,
+        stream_router: WebSocketRouter,
+        chat_router: WebSocketRouter,
+        playback_store: PlaybackStateStore,
+        chat_history: ChatHistoryService,
+    ):
+        self.registry = registry
+        self.stream_router = stream_router
+        self.chat_router = chat_router
+        self.playback_store = playback_store
+        self.chat_history = chat_history
+        self.lock = asyncio.Lock()
+
+    @property
+    def draining(self) -> bool:
+        return self.registry.draining
+
+    async def drain(self) -> None:
+        async with self.lock:
+            # New sockets are refused and parties rehash to other workers
+            # before anybody is told to reconnect.
+            await self.registry.drain()
+            await drain_connections([self.stream_router, self.chat_router])
+            await asyncio.gather(
+                self.playback_store.flush(), self.chat_history.flush()
+            )
+
+
+@lru_cache
+def get_drain_service(
+    registry: Annotated[WorkerRegistry, Depends(get_worker_registry)],
+    stream_router: Annotated[
+        WebSocketRouter, Depends(get_stream_websocket_router)
+    ],
+    chat_router: Annotated[
+        WebSocketRouter, Depends(get_chat_websocket_router)
+    ],
+    playback_store: Annotated[
+        PlaybackStateStore, Depends(get_playback_state_store)
+    ],
+    chat_history: Annotated[
+        ChatHistoryService, Depends(get_chat_history_service)
+    ],
+) -> DrainService:
+    return DrainService(
+        registry, stream_router, chat_router, playback_store, chat_history
+    )
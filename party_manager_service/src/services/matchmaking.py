@@ -0,0 +1,171 @@
+import asyncio
+import time
+import uuid
+from functools import lru_cache
+from typing import Annotated
+
+import redis.asyncio as aioredis
+from core.config import settings
+from fastapi import Depends
+from integration.brokers import IBroker, get_message_broker
+from integration.rabbitmq import PARTY_CREATION_QUEUE
+from integration.redis import get_redis_client
+from schemas.broker import PartyCreationMessage
+
+QUEUE_KEY_PREFIX = "matchmaking:queue:"
+USER_KEY_PREFIX = "matchmaking:user:"
+FILMS_KEY = "matchmaking:films"
+
+# KEYS: film queue, user key, films set
+# ARGV: user id, film id, now, room size, wait timeout, user key prefix
+ENQUEUE_SCRIPT = """
+local waiting_for = redis.call('GET', KEYS[2])
+if waiting_for and waiting_for ~= ARGV[2] then
+    return {-1}
+end
+local now = tonumber(ARGV[3])
+local wait_timeout = tonumber(ARGV[5])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - wait_timeout)
+redis.call('ZADD', KEYS[1], 'NX', now, ARGV[1])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', wait_timeout)
+redis.call('SADD', KEYS[3], ARGV[2])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    return {0, redis.call('ZRANK', KEYS[1], ARGV[1])}
+end
+local room = redis.call('ZPOPMIN', KEYS[1], ARGV[4])
+for i = 1, #room, 2 do
+    redis.call('DEL', ARGV[6] .. room[i])
+end
+return {1, room}
+"""
+
+# KEYS: user key
+# ARGV: user id, queue key prefix
+CANCEL_SCRIPT = """
+local film_id = redis.call('GET', KEYS[1])
+if not film_id then
+    return 0
+end
+redis.call('ZREM', ARGV[2] .. film_id, ARGV[1])
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+# KEYS: film queue, films set
+# ARGV: film id, wait timeout, user key prefix, then user id and score pairs
+RESTORE_SCRIPT = """
+for i = 4, #ARGV, 2 do
+    local user_key = ARGV[3] .. ARGV[i]
+    if redis.call('SET', user_key, ARGV[1], 'NX', 'EX', ARGV[2]) then
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+    end
+end
+redis.call('SADD', KEYS[2], ARGV[1])
+"""
+
+# KEYS: films set
+# ARGV: expiration threshold, queue key prefix
+REAP_SCRIPT = """
+local reaped = 0
+for _, film_id in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    local queue = ARGV[2] .. film_id
+    reaped = reaped + redis.call(
+        'ZREMRANGEBYSCORE', queue, '-inf', ARGV[1]
+    )
+    if redis.call('ZCARD', queue) == 0 then
+        redis.call('SREM', KEYS[1], film_id)
+    end
+end
+return reaped
+"""
+
+
+class MatchmakingService:
+    def __init__(self, redis_client: aioredis.Redis, broker: IBroker):
+        self.redis_client = redis_client
+        self.broker = broker
+        self.enqueue_script = redis_client.register_script(ENQUEUE_SCRIPT)
+        self.cancel_script = redis_client.register_script(CANCEL_SCRIPT)
+        self.restore_script = redis_client.register_script(RESTORE_SCRIPT)
+        self.reap_script = redis_client.register_script(REAP_SCRIPT)
+        self.reaper: asyncio.Task | None = None
+
+    async def enqueue(self, user_id: uuid.UUID, film_id: uuid.UUID) -> dict:
+        if self.reaper is None:
+            self.reaper = asyncio.create_task(self.reap_periodically())
+        result = await self.enqueue_script(
+            keys=[
+                f"{QUEUE_KEY_PREFIX}{film_id}",
+                f"{USER_KEY_PREFIX}{user_id}",
+                FILMS_KEY,
+            ],
+            args=[
+                str(user_id),
+                str(film_id),
+                time.time(),
+                settings.matchmaking_room_size,
+                settings.matchmaking_wait_timeout,
+                USER_KEY_PREFIX,
+            ],
+        )
+        if result[0] == -1:
+            return {"status": "waiting_for_another_film"}
+        if result[0] == 0:
+            return {"status": "waiting", "position": result[1] + 1}
+
+        room = result[1]
+        users_ids = [uuid.UUID(user.decode("utf-8")) for user in room[::2]]
+        try:
+            await self.broker.publish_one(
+                PartyCreationMessage(film_id=film_id, users_ids=users_ids),
+                PARTY_CREATION_QUEUE,
+            )
+        except Exception as e:
+            # Put the room back with its original enqueue times, so nobody
+            # loses their place because of a broker outage. The reaper may
+            # have dropped the emptied queue from the films set meanwhile,
+            # and users who queued for another film are left there.
+            await self.restore_script(
+                keys=[f"{QUEUE_KEY_PREFIX}{film_id}", FILMS_KEY],
+                args=[
+                    str(film_id),
+                    settings.matchmaking_wait_timeout,
+                    USER_KEY_PREFIX,
+                    *room,
+                ],
+            )
+            print(e)
+            return {"status": "waiting"}
+        return {"status": "matched"}
+
+    async def cancel(self, user_id: uuid.UUID) -> bool:
+        cancelled = await self.cancel_script(
+            keys=[f"{USER_KEY_PREFIX}{user_id}"],
+            args=[str(user_id), QUEUE_KEY_PREFIX],
+        )
+        return bool(cancelled)
+
+    async def reap_expired(self) -> int:
+        return await self.reap_script(
+            keys=[FILMS_KEY],
+            args=[
+                time.time() - settings.matchmaking_wait_timeout,
+                QUEUE_KEY_PREFIX,
+            ],
+        )
+
+    async def reap_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(settings.matchmaking_reap_interval)
+            try:
+                await self.reap_expired()
+            except Exception as e:
+                print(e)
+
+
+@lru_cache
+def get_matchmaking_service(
+    redis_client: Annotated[aioredis.Redis, Depends(get_redis_client)],
+    broker: Annotated[IBroker, Depends(get_message_broker)],
+) -> MatchmakingService:
+    return MatchmakingService(redis_client, broker)
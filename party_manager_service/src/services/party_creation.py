@@ -0,0 +1,123 @@
+import asyncio
+import contextlib
+import uuid
+from functools import lru_cache
+from typing import Annotated
+
+from core.config import settings
+from fastapi import Depends
+from integration.brokers import IBroker, get_message_broker
+from integration.rabbitmq import PARTY_MANAGER_EXCHANGE
+from schemas.broker import PartyCreatedMessage, PartyCreationMessage
+from services.broker import PartyManagerService, get_party_manager_service
+
+
+class PartyCreationBatcher:
+    def __init__(
+        self, party_manager_service: PartyManagerService, broker: IBroker
+    ):
+        self.party_manager_service = party_manager_service
+        self.broker = broker
+        self.pending: list[tuple[PartyCreationMessage, asyncio.Future]] = []
+        self.writing: list[tuple[PartyCreationMessage, asyncio.Future]] = []
+        self.has_pending = asyncio.Event()
+        self.batch_full = asyncio.Event()
+        self.writer: asyncio.Task | None = None
+
+    async def consume(self, message: PartyCreationMessage) -> None:
+        # The handler returns, and the message is acked, only after the
+        # batch it belongs to has been written to the storage.
+        await self.submit(message)
+
+    async def submit(self, message: PartyCreationMessage) -> uuid.UUID:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+        self.has_pending.set()
+        if len(self.pending) >= settings.party_creation_batch_size:
+            self.batch_full.set()
+        if self.writer is None or self.writer.done():
+            self.writer = asyncio.create_task(self.write_batches())
+        return await future
+
+    async def write_batches(self) -> None:
+        while True:
+            await self.has_pending.wait()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self.batch_full.wait(),
+                    timeout=settings.party_creation_batch_interval,
+                )
+            batch = self.pending[: settings.party_creation_batch_size]
+            self.pending = self.pending[settings.party_creation_batch_size :]
+            if len(self.pending) < settings.party_creation_batch_size:
+                self.batch_full.clear()
+            if not self.pending:
+                self.has_pending.clear()
+            self.writing = batch
+            await self.write_batch(batch)
+            self.writing = []
+
+    async def write_batch(
+        self, batch: list[tuple[PartyCreationMessage, asyncio.Future]]
+    ) -> None:
+        try:
+            parties_ids = await self.party_manager_service.create_parties(
+                [message for message, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        try:
+            delivered = await self.broker.publish_many(
+                [
+                    PartyCreatedMessage(
+                        party_id=party_id,
+                        film_id=message.film_id,
+                        users_ids=message.users_ids,
+                        redirect_url=(
+                            f"{settings.party_manager_service_url}/{party_id}"
+                        ),
+                    )
+                    for (message, _), party_id in zip(batch, parties_ids)
+                ],
+                exchange=PARTY_MANAGER_EXCHANGE,
+            )
+            if not all(delivered):
+                print(
+                    f"{delivered.count(False)} party creation events "
+                    "were not confirmed by the broker"
+                )
+        except Exception as e:
+            print(e)
+
+        # A handler cancelled meanwhile has already given up on its future.
+        for (_, future), party_id in zip(batch, parties_ids):
+            if not future.done():
+                future.set_result(party_id)
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.cancel()
+            await asyncio.wait([self.writer])
+        # The waiting handlers fail, so their messages are not acked and the
+        # broker delivers them again.
+        for _, future in self.writing + self.pending:
+            if not future.done():
+                future.set_exception(
+                    RuntimeError("Party creation batcher is closed")
+                )
+        self.writing = []
+        self.pending = []
+
+
+@lru_cache
+def get_party_creation_batcher(
+    party_manager_service: Annotated[
+        PartyManagerService, Depends(get_party_manager_service)
+    ],
+    broker: Annotated[IBroker, Depends(get_message_broker)],
+) -> PartyCreationBatcher:
+    return PartyCreationBatcher(party_manager_service, broker)
@@ -0,0 +1,146 @@
+import asyncio
+import time
+import uuid
+from functools import lru_cache
+from typing import Annotated
+
+from core.config import settings
+from fastapi import Depends
+from integration.cache import ICache, get_cache
+
+
+class PlaybackState:
+    __slots__ = ("position", "rate", "paused", "updated_at")
+
+    def __init__(
+        self,
+        position: float = 0.0,
+        rate: float = 1.0,
+        paused: bool = True,
+        updated_at: float = 0.0,
+    ):
+        self.position = position
+        self.rate = rate
+        self.paused = paused
+        self.updated_at = updated_at
+
+    def position_at(self, timestamp: float) -> float:
+        if self.paused:
+            return self.position
+        return self.position + (timestamp - self.updated_at) * self.rate
+
+    def to_sync_message(self, message_type: str = "sync") -> dict:
+        server_ts = time.time()
+        return {
+            "type": message_type,
+            "time": round(self.position_at(server_ts), 3),
+            "rate": self.rate,
+            "paused": self.paused,
+            "server_ts": server_ts,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "time": self.position,
+            "rate": self.rate,
+            "paused": self.paused,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PlaybackState":
+        return cls(
+            position=float(data["time"]),
+            rate=float(data.get("rate", 1.0)),
+            paused=bool(data.get("paused", True)),
+            updated_at=float(data.get("updated_at", 0.0)),
+        )
+
+
+class PlaybackStateStore:
+    def __init__(self, cache: ICache):
+        self.cache = cache
+        self.states: dict[uuid.UUID, PlaybackState] = {}
+        self.dirty: set[uuid.UUID] = set()
+        self.flusher: asyncio.Task | None = None
+
+    def get_local(self, party_id: uuid.UUID) -> PlaybackState | None:
+        return self.states.get(party_id)
+
+    async def get(self, party_id: uuid.UUID) -> PlaybackState | None:
+        state = self.states.get(party_id)
+        if state is None:
+            cached = await self.cache.get_party_state(party_id)
+            if cached:
+                state = PlaybackState.from_dict(cached)
+                self.states[party_id] = state
+        return state
+
+    def update(
+        self,
+        party_id: uuid.UUID,
+        message: dict,
+        updated_at: float | None = None,
+    ) -> PlaybackState:
+        state = self.states.get(party_id)
+        if state is None:
+            state = self.states[party_id] = PlaybackState()
+        if updated_at is None:
+            updated_at = time.time()
+        if updated_at < state.updated_at:
+            return state
+        state.position = float(message["time"])
+        state.rate = float(message.get("rate", state.rate))
+        if message["type"] == "pause":
+            state.paused = True
+        elif message["type"] == "play":
+            state.paused = False
+        elif "paused" in message:
+            state.paused = bool(message["paused"])
+        state.updated_at = updated_at
+        self.dirty.add(party_id)
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self.flush_periodically())
+        return state
+
+    async def flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(settings.playback_flush_interval)
+            await self.flush()
+
+    async def flush(self, party_ids: list[uuid.UUID] | None = None) -> None:
+        if party_ids is None:
+            party_ids = list(self.dirty)
+        party_ids = [
+            party_id for party_id in party_ids if party_id in self.dirty
+        ]
+        self.dirty.difference_update(party_ids)
+        if not party_ids:
+            return
+        try:
+            await self.cache.set_many(
+                {
+                    party_id: self.states[party_id].to_dict()
+                    for party_id in party_ids
+                }
+            )
+        except Exception as e:
+            self.dirty.update(party_ids)
+            print(e)
+
+    async def release(self, party_id: uuid.UUID) -> None:
+        await self.flush([party_id])
+        if party_id not in self.dirty:
+            self.states.pop(party_id, None)
+
+    async def close(self) -> None:
+        if self.flusher is not None:
+            self.flusher.cancel()
+        await self.flush()
+
+
+@lru_cache
+def get_playback_state_store(
+    cache: Annotated[ICache, Depends(get_cache)],
+) -> PlaybackStateStore:
+    return PlaybackStateStore(cache)
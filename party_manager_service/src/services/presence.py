@@ -0,0 +1,174 @@
+import asyncio
+import time
+import uuid
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Annotated
+
+import redis.asyncio as aioredis
+from core.config import settings
+from fastapi import Depends
+from integration.redis import get_redis_client
+
+PARTY_KEY_PREFIX = "presence:party:"
+USER_KEY_PREFIX = "presence:user:"
+HOLDERS_KEY_PREFIX = "presence:holders:"
+
+# KEYS: party key, user key, holders key
+# ARGV: user, party id, node id
+LEAVE_SCRIPT = """
+redis.call('SREM', KEYS[3], ARGV[3])
+if redis.call('SCARD', KEYS[3]) > 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+if redis.call('GET', KEYS[2]) == ARGV[2] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+
+class PresenceService:
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis_client = redis_client
+        self.leave_script = redis_client.register_script(LEAVE_SCRIPT)
+        # Chat and stream sockets of the same user count once per process;
+        # across processes the holders set keeps the user listed until the
+        # last process holding one of their sockets lets go.
+        self.node_id = uuid.uuid4().hex
+        self.members: dict[uuid.UUID, Counter[str]] = defaultdict(Counter)
+        self.heartbeat: asyncio.Task | None = None
+
+    async def join(self, party_id: uuid.UUID, user: str) -> None:
+        self.members[party_id][user] += 1
+        if self.members[party_id][user] > 1:
+            return
+        if self.heartbeat is None:
+            self.heartbeat = asyncio.create_task(self.beat_periodically())
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.zadd(f"{PARTY_KEY_PREFIX}{party_id}", {user: time.time()})
+            pipeline.expire(
+                f"{PARTY_KEY_PREFIX}{party_id}", settings.presence_ttl
+            )
+            pipeline.set(
+                f"{USER_KEY_PREFIX}{user}",
+                str(party_id),
+                ex=settings.presence_ttl,
+            )
+            pipeline.sadd(self.holders_key(party_id, user), self.node_id)
+            pipeline.expire(
+                self.holders_key(party_id, user), settings.presence_ttl
+            )
+            await pipeline.execute()
+
+    @staticmethod
+    def holders_key(party_id: uuid.UUID, user: str) -> str:
+        return f"{HOLDERS_KEY_PREFIX}{party_id}:{user}"
+
+    async def release(
+        self,
+        party_id: uuid.UUID,
+        user: str,
+        client: aioredis.client.Pipeline | None = None,
+    ) -> None:
+        await self.leave_script(
+            keys=[
+                f"{PARTY_KEY_PREFIX}{party_id}",
+                f"{USER_KEY_PREFIX}{user}",
+                self.holders_key(party_id, user),
+            ],
+            args=[user, str(party_id), self.node_id],
+            client=client,
+        )
+
+    async def leave(self, party_id: uuid.UUID, user: str) -> None:
+        members = self.members.get(party_id)
+        if members is None or not members[user]:
+            return
+        members[user] -= 1
+        if members[user]:
+            return
+        del members[user]
+        if not members:
+            del self.members[party_id]
+        try:
+            await self.release(party_id, user)
+        except Exception as e:
+            print(e)
+
+    async def get_members(self, party_id: uuid.UUID) -> list[str]:
+        members = await self.redis_client.zrangebyscore(
+            f"{PARTY_KEY_PREFIX}{party_id}",
+            time.time() - settings.presence_ttl,
+            "+inf",
+        )
+        return [member.decode("utf-8") for member in members]
+
+    async def count(self, party_id: uuid.UUID) -> int:
+        return await self.redis_client.zcount(
+            f"{PARTY_KEY_PREFIX}{party_id}",
+            time.time() - settings.presence_ttl,
+            "+inf",
+        )
+
+    async def get_current_party(self, user: str) -> uuid.UUID | None:
+        party_id = await self.redis_client.get(f"{USER_KEY_PREFIX}{user}")
+        return uuid.UUID(party_id.decode("utf-8")) if party_id else None
+
+    async def beat(self) -> None:
+        if not self.members:
+            return
+        now = time.time()
+        # One round-trip refreshes every local member and drops the ones
+        # whose process stopped refreshing them.
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            for party_id, members in list(self.members.items()):
+                key = f"{PARTY_KEY_PREFIX}{party_id}"
+                pipeline.zadd(key, dict.fromkeys(members, now))
+                pipeline.zremrangebyscore(
+                    key, "-inf", now - settings.presence_ttl
+                )
+                pipeline.expire(key, settings.presence_ttl)
+                for user in members:
+                    pipeline.set(
+                        f"{USER_KEY_PREFIX}{user}",
+                        str(party_id),
+                        ex=settings.presence_ttl,
+                    )
+                    pipeline.sadd(
+                        self.holders_key(party_id, user), self.node_id
+                    )
+                    pipeline.expire(
+                        self.holders_key(party_id, user),
+                        settings.presence_ttl,
+                    )
+            await pipeline.execute()
+
+    async def beat_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(settings.presence_heartbeat_interval)
+            try:
+                await self.beat()
+            except Exception as e:
+                print(e)
+
+    async def close(self) -> None:
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+        members = list(self.members.items())
+        self.members.clear()
+        if not members:
+            return
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            for party_id, users in members:
+                for user in users:
+                    await self.release(party_id, user, client=pipeline)
+            await pipeline.execute()
+
+
+@lru_cache
+def get_presence_service(
+    redis_client: Annotated[aioredis.Redis, Depends(get_redis_client)],
+) -> PresenceService:
+    return PresenceService(redis_client)
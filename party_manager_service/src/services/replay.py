@@ -0,0 +1,116 @@
+import bisect
+import uuid
+from collections import deque
+from functools import lru_cache
+from typing import Annotated
+
+import redis.asyncio as aioredis
+from core.config import settings
+from core.lru import TTLLRUCache
+from core.metrics import metrics
+from fastapi import Depends
+from integration.redis import get_redis_client
+
+SEQ_KEY_PREFIX = "chat:seq:"
+
+
+class ReplayBuffer:
+    __slots__ = ("events",)
+
+    def __init__(self):
+        self.events: deque[dict] = deque(
+            maxlen=settings.chat_replay_buffer_size
+        )
+
+    def record(self, message: dict) -> None:
+        if not self.events or self.events[-1]["seq"] < message["seq"]:
+            self.events.append(message)
+            return
+        # Messages published by other processes may overtake each other.
+        seqs = [event["seq"] for event in self.events]
+        position = bisect.bisect_left(seqs, message["seq"])
+        if position < len(seqs) and seqs[position] == message["seq"]:
+            return
+        if len(self.events) == self.events.maxlen:
+            if position == 0:
+                return
+            self.events.popleft()
+            position -= 1
+        self.events.insert(position, message)
+
+    def since(self, last_seq: int, latest_seq: int) -> list[dict] | None:
+        # Messages posted while this process was not subscribed to the party
+        # never reached the buffer, so it only answers when it holds every
+        # seq from last_seq up to the party's latest one.
+        if not self.events or self.events[-1]["seq"] != latest_seq:
+            return None
+        missed = [event for event in self.events if event["seq"] > last_seq]
+        if len(missed) != latest_seq - last_seq:
+            return None
+        return missed
+
+    def recent(self, limit: int, latest_seq: int) -> list[dict] | None:
+        # Only a buffer holding more than the limit proves that older
+        # messages exist, which the snapshot reports as has_more.
+        if len(self.events) <= limit:
+            return None
+        return self.since(latest_seq - limit, latest_seq)
+
+
+class ChatReplayService:
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis_client = redis_client
+        self.buffers = TTLLRUCache(
+            settings.chat_replay_parties, settings.chat_replay_ttl
+        )
+
+    @staticmethod
+    def seq_key(party_id: uuid.UUID) -> str:
+        return f"{SEQ_KEY_PREFIX}{party_id}"
+
+    async def next_seq(self, party_id: uuid.UUID) -> int:
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.incr(self.seq_key(party_id))
+            pipeline.expire(self.seq_key(party_id), settings.chat_seq_ttl)
+            seq, _ = await pipeline.execute()
+        return seq
+
+    async def get_latest_seq(self, party_id: uuid.UUID) -> int:
+        return int(await self.redis_client.get(self.seq_key(party_id)) or 0)
+
+    def record(self, party_id: uuid.UUID, message: dict) -> None:
+        buffer = self.buffers.get(party_id)
+        if buffer is None:
+            buffer = ReplayBuffer()
+        buffer.record(message)
+        self.buffers.set(party_id, buffer)
+
+    async def get_recent(
+        self, party_id: uuid.UUID, limit: int
+    ) -> list[dict] | None:
+        buffer = self.buffers.get(party_id)
+        if buffer is None:
+            return None
+        return buffer.recent(limit, await self.get_latest_seq(party_id))
+
+    async def get_missed(
+        self, party_id: uuid.UUID, last_seq: int
+    ) -> list[dict] | None:
+        buffer = self.buffers.get(party_id)
+        missed = None
+        if buffer is not None:
+            missed = buffer.since(
+                last_seq, await self.get_latest_seq(party_id)
+            )
+        metrics.increment(
+            "chat_resumes_total",
+            result="snapshot" if missed is None else "replay",
+        )
+        return missed
+
+
+@lru_cache
+def get_chat_replay_service(
+    redis_client: Annotated[aioredis.Redis, Depends(get_redis_client)],
+) -> ChatReplayService:
+    return ChatReplayService(redis_client)
@@ -0,0 +1,79 @@
+import asyncio
+import uuid
+from functools import lru_cache
+from typing import Annotated
+
+from core.config import settings
+from fastapi import Depends
+from services.chat import ChatHistoryService, get_chat_history_service
+from services.playback import PlaybackStateStore, get_playback_state_store
+from services.presence import PresenceService, get_presence_service
+from services.replay import ChatReplayService, get_chat_replay_service
+from services.votes import KickVoteService, get_kick_vote_service
+
+
+class PartySnapshotService:
+    def __init__(
+        self,
+        playback_store: PlaybackStateStore,
+        presence: PresenceService,
+        chat_history: ChatHistoryService,
+        replay: ChatReplayService,
+        kick_votes: KickVoteService,
+    ):
+        self.playback_store = playback_store
+        self.presence = presence
+        self.chat_history = chat_history
+        self.replay = replay
+        self.kick_votes = kick_votes
+
+    async def get_recent_messages(
+        self, party_id: uuid.UUID
+    ) -> tuple[list[dict], bool]:
+        messages = await self.replay.get_recent(
+            party_id, settings.chat_history_limit
+        )
+        if messages is not None:
+            return messages, True
+        return await self.chat_history.get_history(party_id)
+
+    async def build(self, party_id: uuid.UUID) -> dict:
+        (
+            playback_state,
+            members,
+            (messages, has_more),
+            votes,
+        ) = await asyncio.gather(
+            self.playback_store.get(party_id),
+            self.presence.get_members(party_id),
+            self.get_recent_messages(party_id),
+            self.kick_votes.get_open_votes(party_id),
+        )
+        return {
+            "type": "snapshot",
+            "playback": (
+                playback_state.to_sync_message() if playback_state else None
+            ),
+            "members": members,
+            "count": len(members),
+            "messages": messages,
+            "has_more": has_more,
+            "votes": votes,
+        }
+
+
+@lru_cache
+def get_party_snapshot_service(
+    playback_store: Annotated[
+        PlaybackStateStore, Depends(get_playback_state_store)
+    ],
+    presence: Annotated[PresenceService, Depends(get_presence_service)],
+    chat_history: Annotated[
+        ChatHistoryService, Depends(get_chat_history_service)
+    ],
+    replay: Annotated[ChatReplayService, Depends(get_chat_replay_service)],
+    kick_votes: Annotated[KickVoteService, Depends(get_kick_vote_service)],
+) -> PartySnapshotService:
+    return PartySnapshotService(
+        playback_store, presence, chat_history, replay, kick_votes
+    )
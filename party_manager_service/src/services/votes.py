@@ -0,0 +1,372 @@
+import asyncio
+import math
+import time
+import uuid
+from functools import lru_cache
+from typing import Annotated, Hashable
+
+import redis.asyncio as aioredis
+from core.config import settings
+from core.encoders import loads
+from fastapi import Depends, status
+from integration.redis import get_redis_client
+from integration.websocket import (
+    OutboundFrame,
+    WebSocketRouter,
+    get_chat_websocket_router,
+    get_stream_websocket_router,
+)
+from services.presence import PresenceService, get_presence_service
+
+VOTE_KEY_PREFIX = "kick:vote:"
+PARTY_VOTES_KEY_PREFIX = "kick:party:"
+
+# KEYS: party votes, vote, voters, ballots
+# ARGV: accused, vote key prefix, vote id, ttl, party id, accuser,
+#       expires at, voters...
+OPEN_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current and redis.call('EXISTS', ARGV[2] .. current) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('HSET', KEYS[2], 'party_id', ARGV[5], 'accuser', ARGV[6],
+    'accused', ARGV[1], 'yes', 1, 'no', 1, 'voters', #ARGV - 7,
+    'expires_at', ARGV[7])
+redis.call('SADD', KEYS[3], unpack(ARGV, 8))
+redis.call('SADD', KEYS[4], ARGV[6], ARGV[1])
+for i = 1, 4 do
+    redis.call('EXPIRE', KEYS[i], ARGV[4])
+end
+return 1
+"""
+
+# KEYS: vote, voters, ballots
+# ARGV: user, yes or no
+CAST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0
+    or redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 0
+    or redis.call('SADD', KEYS[3], ARGV[1]) == 0 then
+    return false
+end
+redis.call('HINCRBY', KEYS[1], ARGV[2], 1)
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# KEYS: vote, voters, ballots, party votes
+# ARGV: accused, vote id
+FINISH_SCRIPT = """
+local vote = redis.call('HGETALL', KEYS[1])
+if #vote == 0 then
+    return false
+end
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+if redis.call('HGET', KEYS[4], ARGV[1]) == ARGV[2] then
+    redis.call('HDEL', KEYS[4], ARGV[1])
+end
+return vote
+"""
+
+
+def pairs_to_dict(fields: list[bytes]) -> dict[bytes, bytes]:
+    return dict(zip(fields[::2], fields[1::2]))
+
+
+class TimerWheel:
+    def __init__(self, tick: float, slots_count: int):
+        self.tick = tick
+        self.slots: list[set[Hashable]] = [set() for _ in range(slots_count)]
+        self.position = 0
+
+    def schedule(self, item: Hashable, delay: float) -> int:
+        ticks = min(max(math.ceil(delay / self.tick), 1), len(self.slots) - 1)
+        slot = (self.position + ticks) % len(self.slots)
+        self.slots[slot].add(item)
+        return slot
+
+    def cancel(self, item: Hashable, slot: int) -> None:
+        self.slots[slot].discard(item)
+
+    def advance(self) -> set[Hashable]:
+        self.position = (self.position + 1) % len(self.slots)
+        expired = self.slots[self.position]
+        self.slots[self.position] = set()
+        return expired
+
+
+class KickVote:
+    __slots__ = (
+        "vote_id",
+        "party_id",
+        "accuser",
+        "accused",
+        "voters",
+        "yes",
+        "no",
+        "expires_at",
+        "slot",
+    )
+
+    def __init__(
+        self,
+        vote_id: str,
+        party_id: uuid.UUID,
+        accuser: str,
+        accused: str,
+        voters: int,
+        yes: int = 1,
+        no: int = 1,
+        expires_at: float | None = None,
+    ):
+        self.vote_id = vote_id
+        self.party_id = party_id
+        self.accuser = accuser
+        self.accused = accused
+        self.voters = voters
+        # The accuser always votes for the kick and the accused against it.
+        self.yes = yes
+        self.no = no
+        self.expires_at = (
+            time.time() + settings.kick_vote_duration
+            if expires_at is None
+            else expires_at
+        )
+        self.slot = 0
+
+    @classmethod
+    def from_hash(cls, vote_id: str, fields: dict[bytes, bytes]) -> "KickVote":
+        vote = {
+            key.decode("utf-8"): value.decode("utf-8")
+            for key, value in fields.items()
+        }
+        return cls(
+            vote_id,
+            uuid.UUID(vote["party_id"]),
+            vote["accuser"],
+            vote["accused"],
+            int(vote["voters"]),
+            int(vote["yes"]),
+            int(vote["no"]),
+            float(vote["expires_at"]),
+        )
+
+    @classmethod
+    def from_message(cls, party_id: uuid.UUID, message: dict) -> "KickVote":
+        return cls(
+            message["vote_id"],
+            party_id,
+            message["accuser"],
+            message["accused"],
+            message["voters"],
+            message["yes"],
+            message["no"],
+            message["expires_at"],
+        )
+
+    @property
+    def passed(self) -> bool:
+        return self.yes * 100 > settings.kick_vote_quorum * self.voters
+
+    @property
+    def can_pass(self) -> bool:
+        remaining = self.voters - self.yes - self.no
+        return (
+            self.yes + remaining
+        ) * 100 > settings.kick_vote_quorum * self.voters
+
+    def to_message(self, message_type: str) -> dict:
+        return {
+            "type": message_type,
+            "vote_id": self.vote_id,
+            "accuser": self.accuser,
+            "accused": self.accused,
+            "yes": self.yes,
+            "no": self.no,
+            "voters": self.voters,
+            "expires_at": self.expires_at,
+        }
+
+
+# Votes, ballots and voters live in Redis, so every worker serving the
+# party counts the same ballots and the whole party gets a say. Each worker
+# with sockets in the party expires the vote and kicks its own sockets;
+# FINISH_SCRIPT lets only one of them announce the result.
+class KickVoteService:
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        chat_router: WebSocketRouter,
+        stream_router: WebSocketRouter,
+        presence: PresenceService,
+    ):
+        self.redis_client = redis_client
+        self.open_script = redis_client.register_script(OPEN_SCRIPT)
+        self.cast_script = redis_client.register_script(CAST_SCRIPT)
+        self.finish_script = redis_client.register_script(FINISH_SCRIPT)
+        self.chat_router = chat_router
+        self.stream_router = stream_router
+        self.presence = presence
+        self.votes: dict[str, KickVote] = {}
+        self.timer_wheel = TimerWheel(
+            settings.kick_vote_timer_tick,
+            math.ceil(
+                settings.kick_vote_duration / settings.kick_vote_timer_tick
+            )
+            + 2,
+        )
+        self.ticker: asyncio.Task | None = None
+
+    @staticmethod
+    def vote_keys(vote_id: str) -> list[str]:
+        key = f"{VOTE_KEY_PREFIX}{vote_id}"
+        return [key, f"{key}:voters", f"{key}:ballots"]
+
+    async def get_open_votes(self, party_id: uuid.UUID) -> list[dict]:
+        vote_ids = await self.redis_client.hvals(
+            f"{PARTY_VOTES_KEY_PREFIX}{party_id}"
+        )
+        if not vote_ids:
+            return []
+        async with self.redis_client.pipeline(transaction=False) as pipeline:
+            for vote_id in vote_ids:
+                pipeline.hgetall(f"{VOTE_KEY_PREFIX}{vote_id.decode('utf-8')}")
+            votes = await pipeline.execute()
+        return [
+            KickVote.from_hash(vote_id.decode("utf-8"), vote).to_message(
+                "vote"
+            )
+            for vote_id, vote in zip(vote_ids, votes)
+            if vote
+        ]
+
+    async def open_vote(
+        self, party_id: uuid.UUID, accuser: str, accused: str
+    ) -> KickVote | None:
+        voters = await self.presence.get_members(party_id)
+        if accuser == accused or not {accuser, accused} <= set(voters):
+            return None
+
+        vote = KickVote(
+            uuid.uuid4().hex, party_id, accuser, accused, len(voters)
+        )
+        opened = await self.open_script(
+            keys=[f"{PARTY_VOTES_KEY_PREFIX}{party_id}"]
+            + self.vote_keys(vote.vote_id),
+            args=[
+                accused,
+                VOTE_KEY_PREFIX,
+                vote.vote_id,
+                math.ceil(settings.kick_vote_duration) * 2,
+                str(party_id),
+                accuser,
+                vote.expires_at,
+                *voters,
+            ],
+        )
+        if not opened:
+            return None
+
+        self.watch(vote)
+        self.chat_router.broadcast(party_id, vote.to_message("vote_started"))
+        await self.evaluate(vote)
+        return vote
+
+    def watch(self, vote: KickVote) -> None:
+        if vote.vote_id in self.votes:
+            return
+        vote.slot = self.timer_wheel.schedule(
+            vote.vote_id, vote.expires_at - time.time()
+        )
+        self.votes[vote.vote_id] = vote
+        if self.ticker is None:
+            self.ticker = asyncio.create_task(self.expire_votes())
+
+    def forget(self, vote_id: str) -> None:
+        vote = self.votes.pop(vote_id, None)
+        if vote is not None:
+            self.timer_wheel.cancel(vote_id, vote.slot)
+
+    async def cast(self, vote_id: str, user: str, value: bool) -> None:
+        fields = await self.cast_script(
+            keys=self.vote_keys(vote_id), args=[user, "yes" if value else "no"]
+        )
+        if not fields:
+            return
+        vote = KickVote.from_hash(vote_id, pairs_to_dict(fields))
+        self.chat_router.broadcast(
+            vote.party_id, vote.to_message("vote_updated")
+        )
+        await self.evaluate(vote)
+
+    async def evaluate(self, vote: KickVote) -> None:
+        if vote.passed:
+            await self.finish(vote, passed=True)
+        elif not vote.can_pass:
+            await self.finish(vote, passed=False)
+
+    async def finish(self, vote: KickVote, passed: bool) -> None:
+        self.forget(vote.vote_id)
+        fields = await self.finish_script(
+            keys=self.vote_keys(vote.vote_id)
+            + [f"{PARTY_VOTES_KEY_PREFIX}{vote.party_id}"],
+            args=[vote.accused, vote.vote_id],
+        )
+        if not fields:
+            return
+
+        message = KickVote.from_hash(
+            vote.vote_id, pairs_to_dict(fields)
+        ).to_message("vote_finished")
+        message["passed"] = passed
+        self.chat_router.broadcast(vote.party_id, message)
+        if passed:
+            self.kick(vote.party_id, vote.accused)
+
+    def apply_remote_frame(
+        self, party_id: uuid.UUID, frame: OutboundFrame
+    ) -> None:
+        if frame.message_type == "vote_started":
+            self.watch(KickVote.from_message(party_id, loads(frame.data)))
+        elif frame.message_type == "vote_finished":
+            message = loads(frame.data)
+            self.forget(message["vote_id"])
+            if message["passed"]:
+                self.kick(party_id, message["accused"])
+
+    def kick(self, party_id: uuid.UUID, user: str) -> None:
+        for router in (self.chat_router, self.stream_router):
+            for connection in router.get_connections_by_user(party_id, user):
+                router.remove_connection(party_id, connection.websocket)
+                asyncio.create_task(
+                    connection.close(status.WS_1008_POLICY_VIOLATION)
+                )
+
+    async def expire_votes(self) -> None:
+        while True:
+            await asyncio.sleep(self.timer_wheel.tick)
+            for vote_id in self.timer_wheel.advance():
+                vote = self.votes.get(vote_id)
+                if vote is None:
+                    continue
+                try:
+                    await self.finish(vote, passed=False)
+                except Exception as e:
+                    print(e)
+
+    def close(self) -> None:
+        if self.ticker is not None:
+            self.ticker.cancel()
+
+
+@lru_cache
+def get_kick_vote_service(
+    redis_client: Annotated[aioredis.Redis, Depends(get_redis_client)],
+    chat_router: Annotated[
+        WebSocketRouter, Depends(get_chat_websocket_router)
+    ],
+    stream_router: Annotated[
+        WebSocketRouter, Depends(get_stream_websocket_router)
+    ],
+    presence: Annotated[PresenceService, Depends(get_presence_service)],
+) -> KickVoteService:
+    return KickVoteService(redis_client, chat_router, stream_router, presence)
@@ -1,120 +1,398 @@
 import asyncio
-import json
+import math
+import time
 import uuid
 from functools import lru_cache
 from typing import Annotated
 
-from fastapi import Depends, WebSocket, WebSocketDisconnect
-from integration.cache import ICache, get_cache
-from integration.storages import IStorage, get_storage
+from core.config import settings
+from core.encoders import loads, unpackb
+from core.metrics import metrics
+from fastapi import Depends, WebSocket, WebSocketDisconnect, status
 from integration.websocket import (
+    MSGPACK_SUBPROTOCOL,
+    OutboundFrame,
+    WebSocketConnection,
     WebSocketRouter,
     get_chat_websocket_router,
     get_stream_websocket_router,
 )
+from services.chat import ChatHistoryService, get_chat_history_service
+from services.playback import PlaybackStateStore, get_playback_state_store
+from services.presence import PresenceService, get_presence_service
+from services.replay import ChatReplayService, get_chat_replay_service
+from services.snapshot import PartySnapshotService, get_party_snapshot_service
+from services.votes import KickVoteService, get_kick_vote_service
 
+PLAYBACK_CONTROL_MESSAGE_TYPES = frozenset({"play", "pause", "seeked"})
+CHAT_COMMAND_MESSAGE_TYPES = frozenset({"history", "kick", "vote"})
 
-class WebSocketStreamConnectionService:
-    def __init__(self, websocket_router: WebSocketRouter, cache: ICache):
-        self.websocket_router = websocket_router
-        self.cache = cache
 
-    async def connect(self, party_id: uuid.UUID, websocket: WebSocket) -> None:
-        await websocket.accept()
-        self.websocket_router.add_connection(party_id, websocket)
+async def receive_message(
+    websocket: WebSocket, binary: bool = False
+) -> dict | None:
+    # A frame of the wrong kind or one that does not decode to an object
+    # comes back as None; only a disconnect is raised.
+    try:
+        if binary:
+            message = unpackb(await websocket.receive_bytes())
+        else:
+            message = loads(await websocket.receive_text())
+    except (KeyError, TypeError, ValueError):
+        return None
+    return message if isinstance(message, dict) else None
 
-        party_watch_time = await self.cache.get(party_id)
-        if party_watch_time:
-            await websocket.send_json(
-                {
-                    "type": "timeupdate",
-                    "time": json.loads(party_watch_time.decode("utf-8"))[
-                        "time"
-                    ],
-                }
+
+def is_number(value) -> bool:
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
+def is_valid_stream_message(message: dict) -> bool:
+    if message.get("type") in PLAYBACK_CONTROL_MESSAGE_TYPES:
+        return is_number(message.get("time")) and is_number(
+            message.get("rate", 1.0)
+        )
+    return True
+
+
+def is_valid_chat_message(message: dict) -> bool:
+    match message["type"]:
+        case "history":
+            before, limit = message.get("before"), message.get("limit")
+            return (before is None or isinstance(before, str)) and (
+                limit is None
+                or isinstance(limit, int)
+                and not isinstance(limit, bool)
+                and limit > 0
+            )
+        case "kick":
+            return isinstance(message.get("user"), str)
+        case "vote":
+            return isinstance(message.get("vote_id"), str) and isinstance(
+                message.get("value"), bool
             )
+        case _:
+            return isinstance(message.get("text"), str)
+
+
+async def reject_invalid_frame(
+    connection: WebSocketConnection, message: dict | None
+) -> None:
+    metrics.increment(
+        "websocket_invalid_frames_total",
+        type="undecodable" if message is None else str(message.get("type")),
+    )
+    await connection.close(status.WS_1003_UNSUPPORTED_DATA)
+
+
+class WebSocketStreamConnectionService:
+    def __init__(
+        self,
+        websocket_router: WebSocketRouter,
+        playback_store: PlaybackStateStore,
+        presence: PresenceService,
+    ):
+        self.websocket_router = websocket_router
+        self.websocket_router.on_remote_frame = self.apply_remote_frame
+        self.playback_store = playback_store
+        self.presence = presence
+        self.ticker: asyncio.Task | None = None
+        self.deferred: dict[WebSocketConnection, dict] = {}
+
+    async def connect(
+        self,
+        username: str,
+        party_id: uuid.UUID,
+        websocket: WebSocket,
+        subprotocol: str | None = None,
+    ) -> None:
+        await websocket.accept(subprotocol=subprotocol)
+        binary = subprotocol == MSGPACK_SUBPROTOCOL
+        connection = self.websocket_router.add_connection(
+            party_id, websocket, username, binary
+        )
+        if self.ticker is None:
+            self.ticker = asyncio.create_task(self.send_sync_ticks())
 
         try:
+            await self.presence.join(party_id, username)
+            playback_state = await self.playback_store.get(party_id)
+            if playback_state:
+                connection.send(playback_state.to_sync_message())
+
             while True:
-                message = await websocket.receive_json()
-                await self.handle_message(party_id, message)
-                await self.cache.set(party_id, {"time": message["time"]})
+                message = await receive_message(websocket, binary)
+                if message is None or not is_valid_stream_message(message):
+                    await reject_invalid_frame(connection, message)
+                    return
+                if connection.admit(message.get("type")):
+                    if message["type"] in PLAYBACK_CONTROL_MESSAGE_TYPES:
+                        self.deferred.pop(connection, None)
+                    await self.handle_message(party_id, connection, message)
+                elif message.get("type") in PLAYBACK_CONTROL_MESSAGE_TYPES:
+                    self.defer(party_id, connection, message)
         except WebSocketDisconnect:
+            pass
+        finally:
             self.websocket_router.remove_connection(party_id, websocket)
+            await self.presence.leave(party_id, username)
+            if not self.websocket_router.get_websocket_by_party_id(party_id):
+                await self.playback_store.release(party_id)
+
+    async def handle_message(
+        self,
+        party_id: uuid.UUID,
+        connection: WebSocketConnection,
+        message: dict,
+    ) -> None:
+        if message["type"] == "ping":
+            connection.send(
+                {
+                    "type": "pong",
+                    "client_ts": message.get("client_ts"),
+                    "server_ts": time.time(),
+                }
+            )
+        elif message["type"] in PLAYBACK_CONTROL_MESSAGE_TYPES:
+            playback_state = self.playback_store.update(party_id, message)
+            self.websocket_router.broadcast(
+                party_id, playback_state.to_sync_message(message["type"])
+            )
 
-    async def handle_message(self, party_id: uuid.UUID, message: dict) -> None:
-        if message["type"] != "timeupdate":
-            await self.send_to_all(
-                self.websocket_router.get_websocket_by_party_id(party_id),
-                {"type": message["type"], "time": message["time"]},
+    def defer(
+        self,
+        party_id: uuid.UUID,
+        connection: WebSocketConnection,
+        message: dict,
+    ) -> None:
+        # Only the latest throttled control message matters, because the
+        # playback state is last-writer-wins; it is applied once the bucket
+        # refills instead of being lost, and a newer admitted one drops it.
+        if connection not in self.deferred:
+            asyncio.create_task(
+                self.apply_deferred(
+                    party_id,
+                    connection,
+                    connection.retry_after(message["type"]),
+                )
             )
+        self.deferred[connection] = message
 
-    @staticmethod
-    async def send_to_all(
-        websocket_connections: list[WebSocket], message: dict
+    async def apply_deferred(
+        self,
+        party_id: uuid.UUID,
+        connection: WebSocketConnection,
+        delay: float,
     ) -> None:
-        for websocket_connection in websocket_connections:
-            await websocket_connection.send_json(message)
+        await asyncio.sleep(delay)
+        message = self.deferred.pop(connection, None)
+        if message is None or not self.websocket_router.has_connection(
+            party_id, connection
+        ):
+            return
+        # The applied message is charged like an admitted one; if the tokens
+        # were taken meanwhile, it waits for the next one.
+        if not connection.take_token(message["type"]):
+            self.defer(party_id, connection, message)
+            return
+        metrics.increment(
+            "websocket_coalesced_frames_total", type=message["type"]
+        )
+        await self.handle_message(party_id, connection, message)
+
+    def apply_remote_frame(
+        self, party_id: uuid.UUID, frame: OutboundFrame
+    ) -> None:
+        if frame.message_type in PLAYBACK_CONTROL_MESSAGE_TYPES:
+            message = loads(frame.data)
+            self.playback_store.update(
+                party_id, message, updated_at=message["server_ts"]
+            )
+
+    async def send_sync_ticks(self) -> None:
+        while True:
+            await asyncio.sleep(settings.playback_sync_interval)
+            for party_id in self.websocket_router.get_party_ids():
+                playback_state = self.playback_store.get_local(party_id)
+                if playback_state:
+                    self.websocket_router.deliver(
+                        party_id,
+                        OutboundFrame.from_message(
+                            playback_state.to_sync_message()
+                        ),
+                    )
 
 
 class WebSocketChatConnectionService:
     def __init__(
-        self, websocket_router: WebSocketRouter, storage: IStorage
+        self,
+        websocket_router: WebSocketRouter,
+        chat_history: ChatHistoryService,
+        kick_votes: KickVoteService,
+        presence: PresenceService,
+        replay: ChatReplayService,
+        snapshot: PartySnapshotService,
     ) -> None:
-        self.storage = storage
+        self.chat_history = chat_history
         self.websocket_router = websocket_router
+        self.websocket_router.on_remote_frame = self.apply_remote_frame
+        self.kick_votes = kick_votes
+        self.presence = presence
+        self.replay = replay
+        self.snapshot = snapshot
 
     async def connect(
-        self, username: str, party_id: uuid.UUID, websocket: WebSocket
+        self,
+        username: str,
+        party_id: uuid.UUID,
+        websocket: WebSocket,
+        last_seq: int | None = None,
     ) -> None:
         await websocket.accept()
-        self.websocket_router.add_connection(party_id, websocket)
-
-        party = await self.storage.find_element_by_properties(
-            {"party_id": str(party_id)}, "parties"
-        )
-        for message in party["messages"]:
-            await websocket.send_json(message)
-
-        await self.send_message_to_users_and_write_in_database(
-            {"type": "chat", "text": f"{username} joined the party!"}, party_id
+        connection = self.websocket_router.add_connection(
+            party_id, websocket, username
         )
 
         try:
-            while True:
-                message = await websocket.receive_json()
-                message["text"] = f"{username}: {message['text']}"
-                await self.send_message_to_users_and_write_in_database(
-                    message, party_id
-                )
-        except WebSocketDisconnect:
-            self.websocket_router.remove_connection(party_id, websocket)
+            await self.presence.join(party_id, username)
+            await self.resume(party_id, connection, last_seq)
             await self.send_message_to_users_and_write_in_database(
-                {"type": "chat", "text": f"{username} left the party!"},
+                {"type": "chat", "text": f"{username} joined the party!"},
                 party_id,
             )
 
+            while True:
+                message = await receive_message(websocket)
+                if message is not None and (
+                    message.get("type") not in CHAT_COMMAND_MESSAGE_TYPES
+                ):
+                    # Anything but a command is a chat line, whatever type
+                    # the client claims, so it is limited, stored and sent
+                    # as one.
+                    message["type"] = "chat"
+                if message is None or not is_valid_chat_message(message):
+                    await reject_invalid_frame(connection, message)
+                    return
+                if connection.admit(message["type"]):
+                    await self.handle_message(
+                        username, party_id, connection, message
+                    )
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.websocket_router.remove_connection(party_id, websocket)
+            await self.presence.leave(party_id, username)
+            await self.leave(username, party_id, connection)
+
+    async def leave(
+        self,
+        username: str,
+        party_id: uuid.UUID,
+        connection: WebSocketConnection,
+    ) -> None:
+        try:
+            # A drained viewer is about to come back through another worker.
+            if connection.close_code != status.WS_1012_SERVICE_RESTART:
+                await self.send_message_to_users_and_write_in_database(
+                    {"type": "chat", "text": f"{username} left the party!"},
+                    party_id,
+                )
+            await self.chat_history.flush([party_id])
+        except Exception as e:
+            print(e)
+
+    async def handle_message(
+        self,
+        username: str,
+        party_id: uuid.UUID,
+        connection: WebSocketConnection,
+        message: dict,
+    ) -> None:
+        match message.get("type"):
+            case "history":
+                await self.send_history(
+                    party_id,
+                    connection,
+                    before=message.get("before"),
+                    limit=message.get("limit"),
+                )
+            case "kick":
+                await self.kick_votes.open_vote(
+                    party_id, username, message["user"]
+                )
+            case "vote":
+                await self.kick_votes.cast(
+                    message["vote_id"], username, bool(message["value"])
+                )
+            case _:
+                await self.send_message_to_users_and_write_in_database(
+                    {"type": "chat", "text": f"{username}: {message['text']}"},
+                    party_id,
+                )
+
+    async def send_presence(
+        self, party_id: uuid.UUID, connection: WebSocketConnection
+    ) -> None:
+        members = await self.presence.get_members(party_id)
+        connection.send(
+            {"type": "presence", "members": members, "count": len(members)}
+        )
+
+    async def resume(
+        self,
+        party_id: uuid.UUID,
+        connection: WebSocketConnection,
+        last_seq: int | None,
+    ) -> None:
+        if last_seq is not None:
+            missed = await self.replay.get_missed(party_id, last_seq)
+            if missed is not None:
+                await self.send_presence(party_id, connection)
+                connection.send({"type": "replay", "messages": missed})
+                return
+        connection.send(await self.snapshot.build(party_id))
+
+    async def send_history(
+        self,
+        party_id: uuid.UUID,
+        connection: WebSocketConnection,
+        before: str | None = None,
+        limit: int | None = None,
+    ) -> None:
+        messages, has_more = await self.chat_history.get_history(
+            party_id, before=before, limit=limit
+        )
+        connection.send(
+            {
+                "type": "history",
+                "before": before,
+                "messages": messages,
+                "has_more": has_more,
+            }
+        )
+
     async def send_message_to_users_and_write_in_database(
         self, message: dict, party_id: uuid.UUID
     ) -> None:
-        await asyncio.gather(
-            self.send_all(
-                message,
-                self.websocket_router.get_websocket_by_party_id(party_id),
-            ),
-            self.storage.update_element(
-                {"party_id": str(party_id)},
-                {"$push": {"messages": message}},
-                "parties",
-            ),
-        )
+        message = self.chat_history.create_message(message)
+        message["seq"] = await self.replay.next_seq(party_id)
+        self.replay.record(party_id, message)
+        self.websocket_router.broadcast(party_id, message)
+        self.chat_history.append(party_id, message)
 
-    @staticmethod
-    async def send_all(
-        message: dict, websocket_connections: list[WebSocket]
+    def apply_remote_frame(
+        self, party_id: uuid.UUID, frame: OutboundFrame
     ) -> None:
-        for websocket_connection in websocket_connections:
-            await websocket_connection.send_json(message)
+        if frame.message_type == "chat":
+            message = loads(frame.data)
+            if "seq" in message:
+                self.replay.record(party_id, message)
+        else:
+            self.kick_votes.apply_remote_frame(party_id, frame)
 
 
 @lru_cache
@@ -122,9 +400,19 @@ def get_websocket_chat_connection_service(
     websocket_router: Annotated[
         WebSocketRouter, Depends(get_chat_websocket_router)
     ],
-    storage: Annotated[IStorage, Depends(get_storage)],
+    chat_history: Annotated[
+        ChatHistoryService, Depends(get_chat_history_service)
+    ],
+    kick_votes: Annotated[KickVoteService, Depends(get_kick_vote_service)],
+    presence: Annotated[PresenceService, Depends(get_presence_service)],
+    replay: Annotated[ChatReplayService, Depends(get_chat_replay_service)],
+    snapshot: Annotated[
+        PartySnapshotService, Depends(get_party_snapshot_service)
+    ],
 ) -> WebSocketChatConnectionService:
-    return WebSocketChatConnectionService(websocket_router, storage)
+    return WebSocketChatConnectionService(
+        websocket_router, chat_history, kick_votes, presence, replay, snapshot
+    )
 
 
 @lru_cache
@@ -132,6 +420,11 @@ def get_websocket_stream_connection_service(
     websocket_router: Annotated[
         WebSocketRouter, Depends(get_stream_websocket_router)
     ],
-    cache: Annotated[ICache, Depends(get_cache)],
+    playback_store: Annotated[
+        PlaybackStateStore, Depends(get_playback_state_store)
+    ],
+    presence: Annotated[PresenceService, Depends(get_presence_service)],
 ) -> WebSocketStreamConnectionService:
-    return WebSocketStreamConnectionService(websocket_router, cache)
+    return WebSocketStreamConnectionService(
+        websocket_router, playback_store, presence
+    )
@@ -0,0 +1,42 @@
+import asyncio
+import uuid
+
+import fakeredis
+import pytest
+from core.config import settings
+from core.hashring import HashRing
+from services.affinity import WorkerRegistry
+
+
+def test_ring_maps_keys_to_stable_nodes():
+    ring = HashRing(["a", "b", "c"], 100)
+    keys = [str(uuid.uuid4()) for _ in range(1000)]
+
+    owners = [ring.get_node(key) for key in keys]
+
+    assert owners == [
+        HashRing(["c", "a", "b"], 100).get_node(key) for key in keys
+    ]
+    assert set(owners) == {"a", "b", "c"}
+
+
+def test_adding_a_node_moves_only_its_share_of_keys():
+    keys = [str(uuid.uuid4()) for _ in range(3000)]
+    before = HashRing(["a", "b", "c"], 100)
+    after = HashRing(["a", "b", "c", "d"], 100)
+
+    moved = [
+        key for key in keys if before.get_node(key) != after.get_node(key)
+    ]
+
+    assert {after.get_node(key) for key in moved} == {"d"}
+    assert len(moved) < len(keys) / 2
+
+
+def test_registry_refuses_affinity_with_several_workers(monkeypatch):
+    monkeypatch.setattr(settings, "affinity_enabled", True)
+    monkeypatch.setattr(settings, "gunicorn_workers", 4)
+    registry = WorkerRegistry(fakeredis.FakeAsyncRedis())
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(registry.start())
@@ -0,0 +1,109 @@
+import asyncio
+import uuid
+
+import pytest
+from bson import ObjectId
+from core.config import settings
+from integration.storages import MongoStorage
+from mongomock_motor import AsyncMongoMockClient
+from services.chat import ChatHistoryService
+
+
+@pytest.fixture
+def chat_history(monkeypatch) -> ChatHistoryService:
+    monkeypatch.setattr(settings, "chat_bucket_size", 10)
+    return ChatHistoryService(
+        MongoStorage(AsyncMongoMockClient(), settings.mongodb_database_name)
+    )
+
+
+def make_messages(start: int, count: int, ts: float) -> list[dict]:
+    return [
+        {
+            "message_id": str(ObjectId()),
+            "type": "chat",
+            "text": f"m{number}",
+            "ts": ts,
+        }
+        for number in range(start, start + count)
+    ]
+
+
+async def write_batches(
+    chat_history: ChatHistoryService, party_id: uuid.UUID, sizes: list[int]
+) -> None:
+    written = 0
+    for size in sizes:
+        chat_history.pending[party_id] = make_messages(written, size, 7200.0)
+        await chat_history.flush([party_id])
+        written += size
+
+
+def test_overflow_batches_keep_history_in_order(chat_history):
+    party_id = uuid.uuid4()
+
+    async def run():
+        await write_batches(chat_history, party_id, [8, 5, 2])
+        return await chat_history.get_history(party_id)
+
+    messages, has_more = asyncio.run(run())
+
+    assert [message["text"] for message in messages] == [
+        f"m{number}" for number in range(15)
+    ]
+    assert not has_more
+
+
+def test_restarted_service_appends_to_newest_bucket(chat_history):
+    party_id = uuid.uuid4()
+
+    async def run():
+        await write_batches(chat_history, party_id, [8, 5])
+        restarted = ChatHistoryService(chat_history.storage)
+        restarted.pending[party_id] = make_messages(13, 2, 7200.0)
+        await restarted.flush([party_id])
+        return await restarted.get_history(party_id)
+
+    messages, _ = asyncio.run(run())
+
+    assert [message["text"] for message in messages] == [
+        f"m{number}" for number in range(15)
+    ]
+
+
+def test_batch_larger_than_bucket_is_split(chat_history):
+    party_id = uuid.uuid4()
+
+    async def run():
+        await write_batches(chat_history, party_id, [25])
+        return await chat_history.storage.find_elements_by_properties(
+            {"party_id": str(party_id)},
+            settings.mongodb_chat_collection_name,
+            sort=[("_id", 1)],
+        )
+
+    buckets = asyncio.run(run())
+
+    assert [bucket["count"] for bucket in buckets] == [10, 10, 5]
+
+
+def test_batch_flushed_during_read_is_not_duplicated(chat_history):
+    party_id = uuid.uuid4()
+    find_buckets = chat_history.storage.find_elements_by_properties
+
+    async def flush_then_find(*args, **kwargs):
+        chat_history.storage.find_elements_by_properties = find_buckets
+        await chat_history.flush([party_id])
+        return await find_buckets(*args, **kwargs)
+
+    async def run():
+        await write_batches(chat_history, party_id, [3])
+        chat_history.pending[party_id] = make_messages(3, 2, 7200.0)
+        chat_history.storage.find_elements_by_properties = flush_then_find
+        return await chat_history.get_history(party_id)
+
+    messages, _ = asyncio.run(run())
+
+    assert [message["text"] for message in messages] == [
+        f"m{number}" for number in range(5)
+    ]
@@ -0,0 +1,34 @@
+import asyncio
+import time
+import uuid
+
+from core.config import settings
+from integration.websocket import WebSocketRouter, drain_connections
+
+
+class StuckWebSocket:
+    async def send_text(self, data: str) -> None:
+        await asyncio.sleep(3600)
+
+    async def close(self, code: int) -> None:
+        pass
+
+
+def test_drain_finishes_within_its_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "drain_timeout", 0.5)
+    monkeypatch.setattr(settings, "drain_wave_size", 2)
+    monkeypatch.setattr(settings, "drain_wave_interval", 0.5)
+    monkeypatch.setattr(settings, "websocket_send_timeout", 5.0)
+
+    async def run():
+        router = WebSocketRouter("stream")
+        for _ in range(10):
+            router.add_connection(uuid.uuid4(), StuckWebSocket())
+        started = time.monotonic()
+        await drain_connections([router])
+        return time.monotonic() - started, router.stats()
+
+    elapsed, stats = asyncio.run(run())
+
+    assert elapsed < 0.7
+    assert stats == {"parties": 0, "connections": 0}
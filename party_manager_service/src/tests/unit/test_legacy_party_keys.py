@@ -0,0 +1,29 @@
+import asyncio
+import json
+import uuid
+
+import fakeredis
+from integration.cache import RedisCache
+from integration.legacy_party_keys import sweep_legacy_party_keys
+
+
+def test_sweep_removes_only_legacy_party_state():
+    redis_client = fakeredis.FakeAsyncRedis()
+    legacy_key, revoked_key, other_key = (str(uuid.uuid4()) for _ in range(3))
+    party_id = uuid.uuid4()
+
+    async def run():
+        await redis_client.set(legacy_key, json.dumps({"time": 1.0}))
+        await redis_client.set(revoked_key, json.dumps({"time": 1.0}), ex=60)
+        await redis_client.set(other_key, json.dumps({"user": "alice"}))
+        await RedisCache(redis_client).set_many({party_id: {"position": 1}})
+        swept = await sweep_legacy_party_keys(redis_client)
+        again = await sweep_legacy_party_keys(redis_client)
+        return swept, again, sorted(await redis_client.keys())
+
+    swept, again, keys = asyncio.run(run())
+
+    assert (swept, again) == (1, 0)
+    assert legacy_key.encode() not in keys
+    assert {revoked_key.encode(), other_key.encode()} <= set(keys)
+    assert f"party-manager:party:{party_id}".encode() in keys
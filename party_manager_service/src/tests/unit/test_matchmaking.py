@@ -0,0 +1,55 @@
+import asyncio
+import uuid
+
+import fakeredis
+from core.config import settings
+from services.matchmaking import (
+    FILMS_KEY,
+    QUEUE_KEY_PREFIX,
+    USER_KEY_PREFIX,
+    MatchmakingService,
+)
+
+
+class FailingBroker:
+    def __init__(self):
+        self.service: MatchmakingService | None = None
+
+    async def publish_one(self, message, queue_name: str) -> None:
+        # The reaper runs while the room is out of its queue.
+        await self.service.reap_expired()
+        raise ConnectionError("broker is down")
+
+
+def test_room_is_restored_when_publishing_fails(monkeypatch):
+    monkeypatch.setattr(settings, "matchmaking_room_size", 2)
+    redis_client = fakeredis.FakeAsyncRedis()
+    broker = FailingBroker()
+    film_id = uuid.uuid4()
+    users_ids = [uuid.uuid4(), uuid.uuid4()]
+
+    async def run():
+        service = broker.service = MatchmakingService(redis_client, broker)
+        results = [
+            await service.enqueue(user_id, film_id) for user_id in users_ids
+        ]
+        service.reaper.cancel()
+        return (
+            results,
+            await redis_client.zrange(f"{QUEUE_KEY_PREFIX}{film_id}", 0, -1),
+            await redis_client.smembers(FILMS_KEY),
+            [
+                await redis_client.get(f"{USER_KEY_PREFIX}{user_id}")
+                for user_id in users_ids
+            ],
+        )
+
+    results, queue, films, waiting_for = asyncio.run(run())
+
+    assert results == [
+        {"status": "waiting", "position": 1},
+        {"status": "waiting"},
+    ]
+    assert queue == [str(user_id).encode() for user_id in users_ids]
+    assert films == {str(film_id).encode()}
+    assert waiting_for == [str(film_id).encode()] * 2
@@ -0,0 +1,54 @@
+import asyncio
+import uuid
+
+from core.config import settings
+from fastapi import status
+from integration.websocket import WebSocketRouter
+
+
+class StuckWebSocket:
+    def __init__(self):
+        self.close_codes = []
+
+    async def send_text(self, data: str) -> None:
+        await asyncio.sleep(3600)
+
+    async def close(self, code: int) -> None:
+        self.close_codes.append(code)
+
+
+def fill_outbox(monkeypatch, message_type: str):
+    monkeypatch.setattr(settings, "websocket_outbox_size", 2)
+
+    async def run():
+        router = WebSocketRouter("chat")
+        websocket = StuckWebSocket()
+        connection = router.add_connection(uuid.uuid4(), websocket)
+        # The first frame is taken by the stuck writer, two more fill up
+        # the outbox.
+        for _ in range(3):
+            connection.send({"type": "chat", "text": "hi"})
+            await asyncio.sleep(0)
+        connection.send({"type": message_type})
+        await asyncio.sleep(0)
+        return router, connection, websocket
+
+    return asyncio.run(run())
+
+
+def test_full_outbox_evicts_instead_of_dropping_control_frames(
+    monkeypatch,
+):
+    router, connection, websocket = fill_outbox(monkeypatch, "chat")
+
+    assert connection.evicted
+    assert websocket.close_codes == [status.WS_1013_TRY_AGAIN_LATER]
+    assert router.stats() == {"parties": 0, "connections": 0}
+
+
+def test_full_outbox_drops_playback_positions(monkeypatch):
+    router, connection, websocket = fill_outbox(monkeypatch, "sync")
+
+    assert not connection.evicted
+    assert len(connection.outbox) == 2
+    assert router.stats() == {"parties": 1, "connections": 1}
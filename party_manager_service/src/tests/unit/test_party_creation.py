@@ -0,0 +1,60 @@
+import asyncio
+import uuid
+
+from schemas.broker import PartyCreationMessage
+from services.party_creation import PartyCreationBatcher
+
+
+class FakePartyManagerService:
+    def __init__(self):
+        self.stalled = False
+
+    async def create_parties(
+        self, party_creation_messages: list[PartyCreationMessage]
+    ) -> list[uuid.UUID]:
+        if self.stalled:
+            await asyncio.sleep(3600)
+        return [uuid.uuid4() for _ in party_creation_messages]
+
+
+class FakeBroker:
+    async def publish_many(self, messages: list, exchange: str) -> list[bool]:
+        return [True] * len(messages)
+
+
+def make_message() -> PartyCreationMessage:
+    return PartyCreationMessage(film_id=uuid.uuid4(), users_ids=[uuid.uuid4()])
+
+
+def test_cancelled_handler_does_not_stop_the_writer():
+    batcher = PartyCreationBatcher(FakePartyManagerService(), FakeBroker())
+
+    async def run():
+        cancelled = asyncio.create_task(batcher.submit(make_message()))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        party_id = await asyncio.wait_for(
+            batcher.submit(make_message()), timeout=1.0
+        )
+        await batcher.close()
+        return party_id
+
+    assert isinstance(asyncio.run(run()), uuid.UUID)
+
+
+def test_close_fails_waiting_handlers():
+    party_manager_service = FakePartyManagerService()
+    party_manager_service.stalled = True
+    batcher = PartyCreationBatcher(party_manager_service, FakeBroker())
+
+    async def run():
+        writing = asyncio.create_task(batcher.submit(make_message()))
+        await asyncio.sleep(0.1)
+        waiting = asyncio.create_task(batcher.submit(make_message()))
+        await asyncio.sleep(0)
+        await batcher.close()
+        return await asyncio.gather(writing, waiting, return_exceptions=True)
+
+    results = asyncio.run(asyncio.wait_for(run(), timeout=1.0))
+
+    assert [type(result) for result in results] == [RuntimeError] * 2
@@ -0,0 +1,47 @@
+import asyncio
+import uuid
+
+import fakeredis
+from services.presence import PresenceService
+
+
+def test_user_stays_present_while_another_worker_holds_a_socket():
+    party_id = uuid.uuid4()
+    server = fakeredis.FakeServer()
+    chat_worker = PresenceService(fakeredis.FakeAsyncRedis(server=server))
+    stream_worker = PresenceService(fakeredis.FakeAsyncRedis(server=server))
+
+    async def run():
+        await chat_worker.join(party_id, "alice")
+        await stream_worker.join(party_id, "alice")
+        await chat_worker.leave(party_id, "alice")
+        during = (
+            await stream_worker.get_members(party_id),
+            await stream_worker.get_current_party("alice"),
+        )
+        await stream_worker.leave(party_id, "alice")
+        after = (
+            await stream_worker.get_members(party_id),
+            await stream_worker.get_current_party("alice"),
+        )
+        await chat_worker.close()
+        await stream_worker.close()
+        return during, after
+
+    during, after = asyncio.run(run())
+
+    assert during == (["alice"], party_id)
+    assert after == ([], None)
+
+
+def test_closing_a_worker_releases_its_members():
+    party_id = uuid.uuid4()
+    presence = PresenceService(fakeredis.FakeAsyncRedis())
+
+    async def run():
+        await presence.join(party_id, "alice")
+        await presence.join(party_id, "alice")
+        await presence.close()
+        return await presence.get_members(party_id)
+
+    assert asyncio.run(run()) == []
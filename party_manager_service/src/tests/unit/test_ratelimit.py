@@ -0,0 +1,31 @@
+import pytest
+from core.ratelimit import TokenBucket
+
+
+def test_bucket_starts_full_and_refills_at_its_rate():
+    bucket = TokenBucket(2.0, 3.0)
+    now = bucket.updated_at
+
+    assert [bucket.consume(now) for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == pytest.approx(0.5)
+    assert bucket.consume(now + 0.5)
+    assert not bucket.consume(now + 0.5)
+
+
+def test_bucket_never_holds_more_than_its_capacity():
+    bucket = TokenBucket(10.0, 2.0)
+
+    bucket.refill(bucket.updated_at + 60)
+
+    assert bucket.tokens == 2.0
+    assert bucket.retry_after() == 0
+
+
+def test_has_token_does_not_take_it():
+    bucket = TokenBucket(1.0, 1.0)
+    now = bucket.updated_at
+
+    assert bucket.has_token(now)
+    assert bucket.has_token(now)
+    bucket.take()
+    assert not bucket.has_token(now)
@@ -0,0 +1,43 @@
+import asyncio
+import uuid
+
+import fakeredis
+import integration.websocket
+from integration.websocket import RedisWebSocketRouter
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, data: str) -> None:
+        self.sent.append(data)
+
+    async def close(self, code: int) -> None:
+        pass
+
+
+def test_frames_reach_only_nodes_with_the_party(monkeypatch):
+    redis_client = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(
+        integration.websocket, "get_redis_client", lambda: redis_client
+    )
+    party_id, other_party_id = uuid.uuid4(), uuid.uuid4()
+
+    async def run():
+        sender = RedisWebSocketRouter("chat", "test:chat")
+        receiver = RedisWebSocketRouter("chat", "test:chat")
+        member, outsider = RecordingWebSocket(), RecordingWebSocket()
+        receiver.add_connection(party_id, member)
+        receiver.add_connection(other_party_id, outsider)
+        await asyncio.sleep(0.1)
+        sender.broadcast(party_id, {"type": "chat", "text": "hi"})
+        await asyncio.sleep(0.5)
+        await sender.close()
+        await receiver.close()
+        return member.sent, outsider.sent
+
+    member_sent, outsider_sent = asyncio.run(run())
+
+    assert member_sent == ['{"type":"chat","text":"hi"}']
+    assert outsider_sent == []
@@ -0,0 +1,90 @@
+import asyncio
+import uuid
+
+import fakeredis
+from core.config import settings
+from services.replay import ChatReplayService, ReplayBuffer
+
+
+def make_buffer(*seqs: int) -> ReplayBuffer:
+    buffer = ReplayBuffer()
+    for seq in seqs:
+        buffer.record({"seq": seq})
+    return buffer
+
+
+def seqs_of(messages: list[dict] | None) -> list[int] | None:
+    return (
+        None if messages is None else [message["seq"] for message in messages]
+    )
+
+
+def test_record_keeps_seq_order_and_drops_duplicates():
+    buffer = make_buffer(1, 3, 2, 3)
+
+    assert seqs_of(buffer.events) == [1, 2, 3]
+
+
+def test_since_returns_missed_messages():
+    buffer = make_buffer(1, 2, 3, 4)
+
+    assert seqs_of(buffer.since(2, 4)) == [3, 4]
+    assert seqs_of(buffer.since(4, 4)) == []
+    assert seqs_of(buffer.since(0, 4)) == [1, 2, 3, 4]
+
+
+def test_since_refuses_a_buffer_behind_the_party():
+    buffer = make_buffer(1, 2, 3)
+
+    assert buffer.since(2, 5) is None
+
+
+def test_since_refuses_gaps_and_seqs_outside_the_buffer():
+    buffer = make_buffer(1, 2, 5, 6)
+
+    assert buffer.since(1, 6) is None
+    assert seqs_of(buffer.since(5, 6)) == [6]
+    assert buffer.since(7, 6) is None
+    assert make_buffer(3, 4).since(1, 4) is None
+
+
+def test_recent_requires_older_messages_and_a_current_tail():
+    buffer = make_buffer(1, 2, 3, 4)
+
+    assert seqs_of(buffer.recent(2, 4)) == [3, 4]
+    assert buffer.recent(4, 4) is None
+    assert buffer.recent(2, 6) is None
+
+
+def test_next_seq_expires_the_counter():
+    party_id = uuid.uuid4()
+    redis_client = fakeredis.FakeAsyncRedis()
+    replay = ChatReplayService(redis_client)
+
+    async def run():
+        seqs = [await replay.next_seq(party_id) for _ in range(2)]
+        ttl = await redis_client.ttl(replay.seq_key(party_id))
+        return seqs, ttl, await replay.get_latest_seq(party_id)
+
+    seqs, ttl, latest_seq = asyncio.run(run())
+
+    assert seqs == [1, 2]
+    assert 0 < ttl <= settings.chat_seq_ttl
+    assert latest_seq == 2
+
+
+def test_get_missed_falls_back_when_other_workers_posted():
+    party_id = uuid.uuid4()
+    replay = ChatReplayService(fakeredis.FakeAsyncRedis())
+
+    async def run():
+        for _ in range(3):
+            replay.record(party_id, {"seq": await replay.next_seq(party_id)})
+        before = await replay.get_missed(party_id, 1)
+        await replay.next_seq(party_id)
+        return before, await replay.get_missed(party_id, 1)
+
+    before, after = asyncio.run(run())
+
+    assert seqs_of(before) == [2, 3]
+    assert after is None
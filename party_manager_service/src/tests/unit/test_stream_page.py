@@ -0,0 +1,54 @@
+import uuid
+
+import pytest
+from api.v1 import stream
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from services.affinity import get_worker_registry
+from services.broker import get_party_manager_service
+
+
+class FakePartyManagerService:
+    def __init__(self, parties: dict[uuid.UUID, dict]):
+        self.parties = parties
+
+    async def get_party_metadata(self, party_id: uuid.UUID) -> dict | None:
+        return self.parties.get(party_id)
+
+
+@pytest.fixture
+def party_id() -> uuid.UUID:
+    return uuid.uuid4()
+
+
+@pytest.fixture
+def client(party_id) -> TestClient:
+    app = FastAPI()
+    app.include_router(stream.router, prefix="/stream")
+    parties = {party_id: {"film_id": uuid.uuid4()}}
+    app.dependency_overrides[get_party_manager_service] = (
+        lambda: FakePartyManagerService(parties)
+    )
+    app.dependency_overrides[get_worker_registry] = lambda: None
+    return TestClient(app)
+
+
+def test_page_is_cacheable_and_revalidates(client, party_id):
+    page = client.get(f"/stream/{party_id}")
+    revalidated = client.get(
+        f"/stream/{party_id}", headers={"If-None-Match": page.headers["etag"]}
+    )
+
+    assert page.status_code == 200
+    assert page.headers["cache-control"].startswith("public")
+    assert revalidated.status_code == 304
+
+
+def test_unknown_party_page_is_not_cached(client):
+    page = client.get(f"/stream/{uuid.uuid4()}")
+
+    assert page.headers["cache-control"] == "no-store"
+
+
+def test_bootstrap_requires_a_token(client, party_id):
+    assert client.get(f"/stream/{party_id}/bootstrap").status_code == 403
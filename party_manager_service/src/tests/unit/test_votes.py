@@ -0,0 +1,96 @@
+import asyncio
+import uuid
+
+import fakeredis
+import pytest
+from core.config import settings
+from integration.websocket import WebSocketRouter
+from services.presence import PresenceService
+from services.votes import KickVote, KickVoteService, TimerWheel
+
+
+class RecordingRouter(WebSocketRouter):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.messages: list[dict] = []
+
+    def broadcast(self, _id: uuid.UUID, message: dict) -> None:
+        self.messages.append(message)
+
+
+def make_worker(server: fakeredis.FakeServer) -> KickVoteService:
+    redis_client = fakeredis.FakeAsyncRedis(server=server)
+    return KickVoteService(
+        redis_client,
+        RecordingRouter("chat"),
+        RecordingRouter("stream"),
+        PresenceService(redis_client),
+    )
+
+
+def test_timer_wheel_expires_items_after_their_delay():
+    timer_wheel = TimerWheel(1.0, 5)
+    timer_wheel.schedule("first", 2.0)
+    slot = timer_wheel.schedule("second", 2.0)
+    timer_wheel.cancel("second", slot)
+
+    assert timer_wheel.advance() == set()
+    assert timer_wheel.advance() == {"first"}
+    assert timer_wheel.advance() == set()
+
+
+def test_timer_wheel_clamps_delays_to_the_wheel():
+    timer_wheel = TimerWheel(1.0, 3)
+    timer_wheel.schedule("late", 60.0)
+    timer_wheel.schedule("now", 0.0)
+
+    assert timer_wheel.advance() == {"now"}
+    assert timer_wheel.advance() == {"late"}
+
+
+@pytest.mark.parametrize(
+    ("yes", "no", "passed", "can_pass"),
+    [(3, 1, False, True), (4, 1, True, True), (2, 3, False, False)],
+)
+def test_vote_needs_more_than_quorum(monkeypatch, yes, no, passed, can_pass):
+    monkeypatch.setattr(settings, "kick_vote_quorum", 60)
+    vote = KickVote("vote", uuid.uuid4(), "alice", "mallory", 5, yes, no)
+
+    assert vote.passed is passed
+    assert vote.can_pass is can_pass
+
+
+def test_votes_are_shared_between_workers():
+    party_id = uuid.uuid4()
+    server = fakeredis.FakeServer()
+    opener, other = make_worker(server), make_worker(server)
+
+    async def run():
+        for user in ("alice", "bob", "carol", "mallory"):
+            await opener.presence.join(party_id, user)
+        vote = await opener.open_vote(party_id, "alice", "mallory")
+        await other.cast(vote.vote_id, "bob", True)
+        await other.cast(vote.vote_id, "bob", True)
+        await other.cast(vote.vote_id, "carol", True)
+        await opener.finish(vote, passed=False)
+        open_votes = await opener.get_open_votes(party_id)
+        await opener.presence.close()
+        return open_votes
+
+    open_votes = asyncio.run(run())
+
+    assert [message["type"] for message in other.chat_router.messages] == [
+        "vote_updated",
+        "vote_updated",
+        "vote_finished",
+    ]
+    finished = other.chat_router.messages[-1]
+    assert (finished["yes"], finished["voters"], finished["passed"]) == (
+        3,
+        4,
+        True,
+    )
+    assert [message["type"] for message in opener.chat_router.messages] == [
+        "vote_started"
+    ]
+    assert open_votes == []
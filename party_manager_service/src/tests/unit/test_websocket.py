@@ -0,0 +1,191 @@
+import asyncio
+import time
+import uuid
+
+import fakeredis
+import pytest
+from core.config import settings
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status
+from fastapi.testclient import TestClient
+from integration.cache import RedisCache
+from integration.storages import MongoStorage
+from integration.websocket import WebSocketRouter
+from mongomock_motor import AsyncMongoMockClient
+from services.chat import ChatHistoryService
+from services.playback import PlaybackStateStore
+from services.presence import PresenceService
+from services.replay import ChatReplayService
+from services.snapshot import PartySnapshotService
+from services.votes import KickVoteService
+from services.websocket import (
+    WebSocketChatConnectionService,
+    WebSocketStreamConnectionService,
+)
+
+
+@pytest.fixture
+def chat_service() -> WebSocketChatConnectionService:
+    redis_client = fakeredis.FakeAsyncRedis()
+    presence = PresenceService(redis_client)
+    chat_history = ChatHistoryService(
+        MongoStorage(AsyncMongoMockClient(), settings.mongodb_database_name)
+    )
+    replay = ChatReplayService(redis_client)
+    router = WebSocketRouter("chat")
+    kick_votes = KickVoteService(
+        redis_client, router, WebSocketRouter("stream"), presence
+    )
+    snapshot = PartySnapshotService(
+        PlaybackStateStore(RedisCache(redis_client)),
+        presence,
+        chat_history,
+        replay,
+        kick_votes,
+    )
+    return WebSocketChatConnectionService(
+        router, chat_history, kick_votes, presence, replay, snapshot
+    )
+
+
+@pytest.fixture
+def stream_service() -> WebSocketStreamConnectionService:
+    redis_client = fakeredis.FakeAsyncRedis()
+    return WebSocketStreamConnectionService(
+        WebSocketRouter("stream"),
+        PlaybackStateStore(RedisCache(redis_client)),
+        PresenceService(redis_client),
+    )
+
+
+@pytest.fixture
+def client(chat_service, stream_service) -> TestClient:
+    app = FastAPI()
+
+    @app.websocket("/chat/{party_id}/{username}")
+    async def chat(websocket: WebSocket, party_id: uuid.UUID, username: str):
+        await chat_service.connect(username, party_id, websocket)
+
+    @app.websocket("/stream/{party_id}/{username}")
+    async def stream(websocket: WebSocket, party_id: uuid.UUID, username: str):
+        await stream_service.connect(username, party_id, websocket)
+
+    with TestClient(app) as client:
+        yield client
+
+
+def wait_for(websocket, message_type: str) -> dict:
+    while True:
+        message = websocket.receive_json()
+        if message["type"] == message_type:
+            return message
+
+
+def test_chat_lines_are_limited_and_sent_as_chat(client, chat_service):
+    party_id = uuid.uuid4()
+    with client.websocket_connect(f"/chat/{party_id}/alice") as websocket:
+        wait_for(websocket, "snapshot")
+        for message_type in ("snapshot", "reconnect", "vote_started", "a|b"):
+            for _ in range(3):
+                websocket.send_json({"type": message_type, "text": "hi"})
+        websocket.send_json({"type": "history"})
+        wait_for(websocket, "history")
+
+    lines = [
+        message
+        for message in chat_service.replay.buffers.get(party_id).events
+        if message["text"] == "alice: hi"
+    ]
+    assert len(lines) == settings.websocket_rate_limits["chat"][1]
+    assert {message["type"] for message in lines} == {"chat"}
+
+
+def wait_until_empty(router: WebSocketRouter) -> dict:
+    deadline = time.monotonic() + 2.0
+    while router.stats()["connections"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return router.stats()
+
+
+def assert_closed_as_unsupported(websocket) -> None:
+    with pytest.raises(WebSocketDisconnect) as closed:
+        while True:
+            websocket.receive_json()
+    assert closed.value.code == status.WS_1003_UNSUPPORTED_DATA
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        {"type": "play"},
+        {"type": "seeked", "time": "12"},
+        {"type": "pause", "time": 1.0, "rate": None},
+    ],
+)
+def test_invalid_stream_frames_close_and_clean_up(
+    client, stream_service, frame
+):
+    party_id = uuid.uuid4()
+    with client.websocket_connect(f"/stream/{party_id}/alice") as websocket:
+        websocket.send_json(frame)
+        assert_closed_as_unsupported(websocket)
+
+    assert wait_until_empty(stream_service.websocket_router) == {
+        "parties": 0,
+        "connections": 0,
+    }
+    assert party_id not in stream_service.presence.members
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        "not json",
+        "[1, 2]",
+        '{"type": "chat"}',
+        '{"type": "history", "limit": "5"}',
+        '{"type": "vote", "vote_id": "id", "value": "yes"}',
+    ],
+)
+def test_invalid_chat_frames_close_and_clean_up(client, chat_service, frame):
+    party_id = uuid.uuid4()
+    with client.websocket_connect(f"/chat/{party_id}/alice") as websocket:
+        wait_for(websocket, "snapshot")
+        websocket.send_text(frame)
+        assert_closed_as_unsupported(websocket)
+
+    assert wait_until_empty(chat_service.websocket_router) == {
+        "parties": 0,
+        "connections": 0,
+    }
+
+
+class SilentWebSocket:
+    async def send_text(self, data: str) -> None:
+        pass
+
+    async def close(self, code: int) -> None:
+        pass
+
+
+def test_deferred_control_frames_take_a_token(monkeypatch, stream_service):
+    monkeypatch.setitem(settings.websocket_rate_limits, "play", (10.0, 1.0))
+    monkeypatch.setattr(settings, "websocket_party_rate_limits", {})
+    party_id = uuid.uuid4()
+
+    async def run():
+        connection = stream_service.websocket_router.add_connection(
+            party_id, SilentWebSocket(), "alice"
+        )
+        assert connection.admit("play")
+        assert not connection.admit("play")
+        stream_service.defer(
+            party_id, connection, {"type": "play", "time": 1.0}
+        )
+        await asyncio.sleep(0.15)
+        applied = stream_service.playback_store.get_local(party_id)
+        return applied, connection.admit("play")
+
+    applied, admitted = asyncio.run(run())
+
+    assert applied is not None
+    assert not admitted